@@ -0,0 +1,112 @@
+"""
+Throughput of the upload preprocessing step per IMAGE_POOL mode.
+
+Runs decode_and_prepare (the work behind every /api/edit upload) on N
+captures with C of them in flight, once per pool mode, and reports
+images/s plus event-loop lag: a 10ms ticker runs alongside, and its worst
+oversleep is how long sockets would have gone unserved.
+
+    cd Backend
+    python -m bench.imaging_bench                            # inline, thread, process
+    python -m bench.imaging_bench --modes thread,process --workers 8 --edge 4000
+    python -m bench.imaging_bench --format WEBP --images 64 --concurrency 16
+
+Parallel speedups need as many cores as workers; cpu_count is part of the
+report so single-core numbers aren't mistaken for a ceiling.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from typing import List
+
+from bench.load_bench import capture_png, latency_summary, log
+from imaging import decode_and_prepare
+from workpool import MODES, ImagePool
+
+FORMATS = ["JPEG", "PNG", "WEBP"]
+MAX_PIXELS = 40_000_000
+
+
+async def bench_mode(mode: str, workers: int, images: List[bytes], concurrency: int,
+                     max_edge: int, fmt: str, quality: int) -> dict:
+    pool = ImagePool(mode, workers)
+    await pool.warm()
+    lag = []
+    stop = asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag.append(time.perf_counter() - started - 0.01)
+
+    latencies = []
+    counter = iter(images)
+
+    async def worker():
+        for data in counter:
+            started = time.perf_counter()
+            await pool.run(decode_and_prepare, data, FORMATS, MAX_PIXELS, max_edge, fmt, quality)
+            latencies.append(time.perf_counter() - started)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    finally:
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await tick
+        pool.shutdown()
+
+    return {
+        "mode": mode,
+        "workers": pool.workers,
+        "images": len(latencies),
+        "elapsed_s": round(elapsed, 4),
+        "images_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "loop_lag_ms": latency_summary(lag),
+    }
+
+
+async def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--modes", default=",".join(MODES))
+    ap.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    ap.add_argument("--images", type=int, default=32)
+    ap.add_argument("--concurrency", type=int, default=8, help="uploads in flight at once")
+    ap.add_argument("--edge", type=int, default=3000, help="capture long edge in px")
+    ap.add_argument("--max-edge", type=int, default=1536, help="UPLOAD_MAX_EDGE")
+    ap.add_argument("--format", default="JPEG", help="UPLOAD_FORMAT")
+    ap.add_argument("--quality", type=int, default=85)
+    args = ap.parse_args(argv)
+
+    # Distinct captures, so nothing benefits from a warm decoder cache
+    images = [capture_png(args.edge, seed=i) for i in range(min(args.images, 8))]
+    images = [images[i % len(images)] for i in range(args.images)]
+
+    results = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        log(f"[imaging] mode={mode} workers={args.workers}")
+        results.append(await bench_mode(mode, args.workers, images, args.concurrency,
+                                        args.max_edge, args.format.upper(), args.quality))
+
+    json.dump({
+        "benchmark": "imaging",
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "capture": {"edge": args.edge, "png_bytes": len(images[0])},
+        "upload": {"max_edge": args.max_edge, "format": args.format.upper(), "quality": args.quality},
+        "concurrency": args.concurrency,
+        "results": results,
+    }, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
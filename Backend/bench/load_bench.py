@@ -0,0 +1,322 @@
+"""
+End-to-end load benchmark for the HTTP edit path and the WebSocket relay.
+
+Starts the real app under uvicorn with EDIT_PROVIDER=stub (no Gemini quota
+spent) and drives it over real sockets:
+
+  edit   POST /api/edit at each --concurrency level x each --sizes image size;
+         latency p50/p95/p99 and requests/s. Every request uses a unique
+         prompt, so the result cache and coalescing never short-circuit it.
+  ws     N paired kiosk/tablet rooms on /ws; tablets send timestamped
+         messages to their kiosk. Reports relay latency, messages/s and
+         server RSS growth per open connection.
+
+    cd Backend
+    pip install -r requirements-dev.txt                         # httpx, websockets
+    python -m bench.load_bench                                  # both suites
+    python -m bench.load_bench edit --concurrency 1,8,32 --sizes 640,1920
+    python -m bench.load_bench ws --rooms 200 --messages 50
+    python -m bench.load_bench --url http://127.0.0.1:8000     # existing server
+
+Output is one JSON document on stdout; progress goes to stderr. With --url
+nothing is started, and memory per connection is only reported if --pid
+names the server process.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from io import BytesIO
+from typing import List, Optional
+
+import httpx
+import websockets
+from PIL import Image
+
+from bench.relay_bench import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def log(*args):
+    print(*args, file=sys.stderr)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_bytes(pid: Optional[int]) -> Optional[int]:
+    """Resident set size of a process (Linux /proc only)."""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def latency_summary(seconds: List[float]) -> dict:
+    ms = sorted(x * 1000 for x in seconds)
+    return {
+        "mean": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50": round(percentile(ms, 50), 3),
+        "p95": round(percentile(ms, 95), 3),
+        "p99": round(percentile(ms, 99), 3),
+        "max": round(ms[-1], 3) if ms else 0.0,
+    }
+
+
+def capture_png(edge: int, seed: int = 0) -> bytes:
+    """Camera-like PNG: seeded, smooth-ish noise that doesn't compress to nothing."""
+    rnd = random.Random(seed)
+    w, h = edge, edge * 3 // 4
+    sw, sh = max(1, w // 4), max(1, h // 4)
+    img = Image.frombytes("RGB", (sw, sh), rnd.randbytes(sw * sh * 3)).resize((w, h), Image.BICUBIC)
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class Server:
+    """The app under uvicorn in a child process, stub provider, logs discarded."""
+
+    def __init__(self, stub_latency_s: float, max_inflight: int, extra_env: Optional[dict] = None):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = {
+            **os.environ,
+            "EDIT_PROVIDER": "stub",
+            "STUB_LATENCY_S": str(stub_latency_s),
+            "STUB_JITTER_S": "0",
+            "GEMINI_MAX_INFLIGHT": str(max_inflight),
+            "GEMINI_RATE_PER_S": "0",
+            "SESSION_BACKEND": "memory",
+            **(extra_env or {}),
+        }
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+    @property
+    def pid(self) -> int:
+        return self.proc.pid
+
+    async def wait_ready(self, timeout: float = 30.0, interval: float = 0.2):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as c:
+            while time.monotonic() < deadline:
+                if self.proc.poll() is not None:
+                    raise RuntimeError("server exited during startup")
+                try:
+                    if (await c.get(f"{self.url}/ping")).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(interval)
+        raise RuntimeError("server did not become ready")
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+# ---------------- /api/edit ----------------
+async def bench_edit(url: str, concurrency: int, edge: int, requests: int) -> dict:
+    image = capture_png(edge, seed=edge)
+    latencies, errors = [], 0
+    counter = iter(range(requests))
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                r = await client.post(
+                    f"{url}/api/edit",
+                    files={"image_file": ("capture.png", image, "image/png")},
+                    data={"prompt": f"bench {uuid.uuid4().hex}"},
+                )
+                ok = r.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=300) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "concurrency": concurrency,
+        "image_edge": edge,
+        "upload_bytes": len(image),
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "requests_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": latency_summary(latencies),
+    }
+
+
+# ---------------- /ws relay ----------------
+async def bench_ws(url: str, rooms: int, messages: int, payload_bytes: int, pid: Optional[int]) -> dict:
+    ws_url = url.replace("http", "ws", 1)
+    latencies = []
+    expected = rooms * messages
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient() as c:
+        sids = [(await c.post(f"{url}/session")).json()["sessionId"] for _ in range(rooms)]
+
+    await asyncio.sleep(0.5)
+    rss_before = rss_bytes(pid)
+
+    pairs = []
+    for sid in sids:
+        kiosk = await websockets.connect(f"{ws_url}/ws?session={sid}&role=kiosk", max_size=None)
+        tablet = await websockets.connect(f"{ws_url}/ws?session={sid}&role=tablet", max_size=None)
+        pairs.append((kiosk, tablet))
+
+    async def receive(kiosk):
+        async for raw in kiosk:
+            msg = json.loads(raw)
+            if msg.get("type") == "PING":
+                await kiosk.send(json.dumps({"type": "PONG", "ts": msg.get("ts")}))
+            elif msg.get("type") == "BENCH":
+                latencies.append(time.perf_counter() - msg["t"])
+                if len(latencies) >= expected:
+                    done.set()
+
+    async def drain(tablet):
+        async for _ in tablet:
+            pass
+
+    readers = [asyncio.create_task(receive(k)) for k, _ in pairs]
+    readers += [asyncio.create_task(drain(t)) for _, t in pairs]
+    await asyncio.sleep(0.5)
+    rss_connected = rss_bytes(pid)
+
+    filler = "x" * payload_bytes
+
+    async def sender(tablet):
+        for _ in range(messages):
+            await tablet.send(json.dumps({"type": "BENCH", "t": time.perf_counter(), "pad": filler}))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender(t) for _, t in pairs))
+    try:
+        await asyncio.wait_for(done.wait(), timeout=120)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+
+    for task in readers:
+        task.cancel()
+    for kiosk, tablet in pairs:
+        await kiosk.close()
+        await tablet.close()
+
+    per_conn = None
+    if rss_before is not None and rss_connected is not None:
+        per_conn = round((rss_connected - rss_before) / (2 * rooms))
+    return {
+        "rooms": rooms,
+        "connections": 2 * rooms,
+        "messages_per_room": messages,
+        "payload_bytes": payload_bytes,
+        "delivered": len(latencies),
+        "expected": expected,
+        "elapsed_s": round(elapsed, 4),
+        "msgs_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "server_rss_bytes": {"before": rss_before, "connected": rss_connected},
+        "rss_bytes_per_connection": per_conn,
+    }
+
+
+def _ints(text: str) -> List[int]:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+async def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("suites", nargs="*", default=["edit", "ws"], help="edit and/or ws")
+    ap.add_argument("--url", default=None, help="benchmark a running server instead of starting one")
+    ap.add_argument("--pid", type=int, default=None, help="server pid for RSS readings with --url")
+    ap.add_argument("--stub-latency", type=float, default=0.5, help="seconds per stub model call")
+    ap.add_argument("--max-inflight", type=int, default=64, help="GEMINI_MAX_INFLIGHT for the server")
+    ap.add_argument("--concurrency", default="1,4,16")
+    ap.add_argument("--sizes", default="640,1536", help="capture long edge in px")
+    ap.add_argument("--requests", type=int, default=32, help="edit requests per concurrency/size point")
+    ap.add_argument("--rooms", type=int, default=50)
+    ap.add_argument("--messages", type=int, default=20)
+    ap.add_argument("--payload-bytes", type=int, default=256)
+    args = ap.parse_args(argv)
+
+    server = None
+    url, pid = args.url, args.pid
+    if url is None:
+        server = Server(args.stub_latency, args.max_inflight)
+        url, pid = server.url, server.pid
+    try:
+        if server is not None:
+            await server.wait_ready()
+        report = {
+            "benchmark": "load",
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "server": {"url": url, "started": server is not None, "stub_latency_s": args.stub_latency,
+                       "max_inflight": args.max_inflight},
+        }
+        if "edit" in args.suites:
+            report["edit"] = []
+            for edge in _ints(args.sizes):
+                for concurrency in _ints(args.concurrency):
+                    log(f"[edit] concurrency={concurrency} edge={edge}")
+                    requests = max(args.requests, concurrency)
+                    report["edit"].append(await bench_edit(url, concurrency, edge, requests))
+        if "ws" in args.suites:
+            log(f"[ws] rooms={args.rooms} messages={args.messages}")
+            report["ws"] = await bench_ws(url, args.rooms, args.messages, args.payload_bytes, pid)
+    finally:
+        if server is not None:
+            server.stop()
+
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+"""
+Relay latency benchmark for the session store backends.
+
+Pairs N kiosk/tablet sessions, then has every tablet send M timestamped
+messages to its kiosk through the store, and reports delivery latency
+percentiles and throughput per backend as JSON.
+
+    cd Backend
+    python -m bench.relay_bench                       # memory + redis (fakeredis TCP stand-in)
+    python -m bench.relay_bench --redis-url redis://localhost:6379/0
+    python -m bench.relay_bench --backends memory --rooms 200 --messages 50
+
+The redis run goes over a real TCP socket. With no --redis-url it starts
+fakeredis' TcpFakeServer in a thread (from requirements-dev.txt). Numbers from
+the stand-in show protocol overhead only, not production Redis latency.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+from session_store import InMemorySessionStore, RedisSessionStore
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_redis() -> str:
+    from fakeredis import TcpFakeServer
+
+    port = _free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"redis://127.0.0.1:{port}/0"
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+async def run_backend(store, rooms: int, messages: int, payload_bytes: int) -> dict:
+    latencies = []
+    expected = rooms * messages
+    done = asyncio.Event()
+
+    async def deliver(sid, role, message, status):
+        sent = float(message.split("|", 1)[0])
+        latencies.append(time.perf_counter() - sent)
+        if len(latencies) >= expected:
+            done.set()
+
+    await store.start(deliver)
+    sids = [uuid.uuid4().hex[:6].upper() for _ in range(rooms)]
+    for sid in sids:
+        await store.create(sid)
+        for role in ("kiosk", "tablet"):
+            assert await store.claim(sid, role)
+        await store.subscribe(sid, "kiosk")
+    await asyncio.sleep(0.2)  # let subscriptions settle on pub/sub backends
+
+    filler = "x" * payload_bytes
+
+    async def sender(sid):
+        for _ in range(messages):
+            await store.publish(sid, "kiosk", f"{time.perf_counter()}|{filler}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(sender(sid) for sid in sids))
+    try:
+        await asyncio.wait_for(done.wait(), timeout=60)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - started
+
+    for sid in sids:
+        await store.unsubscribe(sid, "kiosk")
+        for role in ("kiosk", "tablet"):
+            await store.release(sid, role)
+    await store.close()
+
+    ms = [x * 1000 for x in latencies]
+    return {
+        "backend": store.name,
+        "rooms": rooms,
+        "messages_per_room": messages,
+        "payload_bytes": payload_bytes,
+        "delivered": len(latencies),
+        "expected": expected,
+        "elapsed_s": round(elapsed, 4),
+        "msgs_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(ms), 3) if ms else 0.0,
+            "p50": round(percentile(ms, 50), 3),
+            "p95": round(percentile(ms, 95), 3),
+            "p99": round(percentile(ms, 99), 3),
+            "max": round(max(ms), 3) if ms else 0.0,
+        },
+    }
+
+
+async def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--backends", default="memory,redis")
+    ap.add_argument("--rooms", type=int, default=50)
+    ap.add_argument("--messages", type=int, default=20)
+    ap.add_argument("--payload-bytes", type=int, default=256)
+    ap.add_argument("--redis-url", default=None)
+    args = ap.parse_args(argv)
+
+    results = []
+    for name in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        if name == "memory":
+            store = InMemorySessionStore()
+        elif name == "redis":
+            store = RedisSessionStore(url=args.redis_url or start_fake_redis())
+        else:
+            print(f"unknown backend {name}", file=sys.stderr)
+            continue
+        # Keep stdout clean for the JSON report; server-side logging goes to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            results.append(await run_backend(store, args.rooms, args.messages, args.payload_bytes))
+
+    json.dump({"benchmark": "relay", "results": results}, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
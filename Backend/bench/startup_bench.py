@@ -0,0 +1,118 @@
+"""
+Import and startup time of the backend, for tracking cold-start regressions.
+
+  import    `import main` in fresh interpreters (median/min/max over --runs),
+            plus the slowest modules it pulls in (python -X importtime)
+  startup   uvicorn process spawn -> first 200 from /ping, over --runs
+
+Both use EDIT_PROVIDER=gemini with a dummy key by default, since the real
+provider is what production workers start with; nothing is sent upstream
+(PROVIDER_WARMUP=0 for the server runs).
+
+    cd Backend
+    python -m bench.startup_bench
+    python -m bench.startup_bench --runs 10 --top 15
+    python -m bench.startup_bench --max-import-s 0.8     # exit 1 if the median is slower (CI)
+
+Output is one JSON document on stdout; progress goes to stderr.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+from bench.load_bench import BACKEND_DIR, Server, log
+
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def _env(provider: str) -> dict:
+    return {**os.environ, "EDIT_PROVIDER": provider, "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY", "bench"),
+            "SESSION_BACKEND": "memory", "PROVIDER_WARMUP": "0"}
+
+
+def _summary(seconds: List[float]) -> dict:
+    return {
+        "median_s": round(statistics.median(seconds), 4),
+        "min_s": round(min(seconds), 4),
+        "max_s": round(max(seconds), 4),
+        "runs": len(seconds),
+    }
+
+
+def bench_import(provider: str, runs: int) -> dict:
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=_env(provider),
+                             capture_output=True, text=True, check=True).stdout
+        times.append(float(out.strip().splitlines()[-1]))
+    return _summary(times)
+
+
+def slowest_imports(provider: str, top: int) -> List[dict]:
+    """Modules imported directly by main (or lazily while it runs), by cumulative import time."""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND_DIR,
+                         env=_env(provider), capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            rows.append({"module": name.strip(), "cumulative_s": int(cumulative) / 1e6})
+    rows.sort(key=lambda r: r["cumulative_s"], reverse=True)
+    return [{**r, "cumulative_s": round(r["cumulative_s"], 4)} for r in rows[:top]]
+
+
+async def bench_startup(provider: str, runs: int) -> dict:
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        server = Server(0.0, 4, extra_env=_env(provider))
+        try:
+            await server.wait_ready(interval=0.01)
+            times.append(time.perf_counter() - started)
+        finally:
+            server.stop()
+    return _summary(times)
+
+
+async def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--provider", default="gemini", help="EDIT_PROVIDER for the measured processes")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    ap.add_argument("--max-import-s", type=float, default=None, help="fail if median import time exceeds this")
+    args = ap.parse_args(argv)
+
+    log(f"[startup] import main x{args.runs}")
+    imports = bench_import(args.provider, args.runs)
+    log(f"[startup] uvicorn to first /ping x{args.runs}")
+    startup = await bench_startup(args.provider, args.runs)
+
+    json.dump({
+        "benchmark": "startup",
+        "python": platform.python_version(),
+        "provider": args.provider,
+        "import": imports,
+        "slowest_imports": slowest_imports(args.provider, args.top),
+        "startup_to_ready": startup,
+    }, sys.stdout, indent=2)
+    print()
+
+    if args.max_import_s is not None and imports["median_s"] > args.max_import_s:
+        log(f"[startup] median import {imports['median_s']}s exceeds {args.max_import_s}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,175 @@
+"""
+Content-addressed cache for /api/edit results.
+
+Key = sha256(model name + final prompt + sha256(decoded pixels)), so the same capture
+re-sent with the same prompt is served without another Gemini call.
+
+Two tiers:
+  - memory: LRU bounded by total bytes (EDIT_CACHE_MAX_BYTES)
+  - disk (optional): one file per key under EDIT_CACHE_DIR, bounded by
+    EDIT_CACHE_DISK_MAX_BYTES, oldest entries evicted first
+"""
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image
+
+
+def pixel_digest(pil_image: Image.Image) -> bytes:
+    """Hash of the decoded pixels (not the container bytes), mode and size."""
+    h = hashlib.sha256()
+    h.update(f"{pil_image.mode}:{pil_image.size[0]}x{pil_image.size[1]}".encode("ascii"))
+    h.update(b"\0")
+    h.update(pil_image.tobytes())
+    return h.digest()
+
+
+def fingerprint(pil_image: Optional[Image.Image], prompt: str, model: str,
+                digest: Optional[bytes] = None) -> str:
+    """
+    Cache key for one edit. Pass a precomputed pixel_digest() to key several
+    prompts against the same image without hashing the pixels again.
+    """
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(prompt.encode("utf-8"))
+    h.update(b"\0")
+    h.update(digest if digest is not None else pixel_digest(pil_image))
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+
+        # key -> (data, media_type), most recently used last
+        self._mem: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self._mem_bytes = 0
+        # key -> file size, oldest first
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+
+        self.stats = {
+            "hits_memory": 0,
+            "hits_disk": 0,
+            "misses": 0,
+            "evictions_memory": 0,
+            "evictions_disk": 0,
+        }
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._load_disk_index()
+
+    # ---------- public ----------
+    async def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        hit = self._mem.get(key)
+        if hit is not None:
+            self._mem.move_to_end(key)
+            self.stats["hits_memory"] += 1
+            return hit
+
+        if key in self._disk:
+            try:
+                hit = await asyncio.to_thread(self._read_disk, key)
+            except OSError:
+                self._drop_disk_entry(key)
+                hit = None
+            if hit is not None:
+                self.stats["hits_disk"] += 1
+                self._put_memory(key, *hit)
+                return hit
+
+        self.stats["misses"] += 1
+        return None
+
+    async def put(self, key: str, data: bytes, media_type: str):
+        self._put_memory(key, data, media_type)
+        if self.disk_dir and self.disk_max_bytes > 0 and key not in self._disk:
+            try:
+                size = await asyncio.to_thread(self._write_disk, key, data, media_type)
+            except OSError as e:
+                print(f"[cache] disk write failed for {key[:12]}: {e}")
+                return
+            self._disk[key] = size
+            self._disk_bytes += size
+            self._evict_disk()
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "memory_entries": len(self._mem),
+            "memory_bytes": self._mem_bytes,
+            "memory_max_bytes": self.max_bytes,
+            "disk_entries": len(self._disk),
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+        }
+
+    # ---------- memory tier ----------
+    def _put_memory(self, key: str, data: bytes, media_type: str):
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= len(old[0])
+        self._mem[key] = (data, media_type)
+        self._mem_bytes += size
+        while self._mem_bytes > self.max_bytes:
+            _, (evicted, _) = self._mem.popitem(last=False)
+            self._mem_bytes -= len(evicted)
+            self.stats["evictions_memory"] += 1
+
+    # ---------- disk tier ----------
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key)
+
+    def _load_disk_index(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            path = os.path.join(self.disk_dir, name)
+            if len(name) != 64 or not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _read_disk(self, key: str) -> Tuple[bytes, str]:
+        # File layout: "<media type>\n<raw bytes>"
+        with open(self._path(key), "rb") as f:
+            media_type = f.readline().decode("ascii").strip()
+            return f.read(), media_type
+
+    def _write_disk(self, key: str, data: bytes, media_type: str) -> int:
+        path = self._path(key)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(media_type.encode("ascii") + b"\n")
+            f.write(data)
+        os.replace(tmp, path)
+        return os.path.getsize(path)
+
+    def _drop_disk_entry(self, key: str):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        while self._disk and self._disk_bytes > self.disk_max_bytes:
+            key = next(iter(self._disk))
+            self._drop_disk_entry(key)
+            self.stats["evictions_disk"] += 1
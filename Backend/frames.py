@@ -0,0 +1,106 @@
+"""
+Binary WebSocket frames for the kiosk/tablet relay.
+
+Layout (all integers big-endian):
+
+    u8   version        (1)
+    u8   flags          (bit 0 = payload is zlib/deflate compressed)
+    u8   type length    n
+    n    type           ASCII message type, e.g. "RESULT"
+    u8   mime length    m
+    m    mime           ASCII media type of the payload, may be empty
+    u32  payload length
+    ...  payload        raw bytes (e.g. the PNG/JPEG result)
+
+The relay only reads the header; payload bytes are forwarded untouched unless
+the receiving peer needs them inflated or converted to a JSON data URL.
+Inflation is capped at `max_size` bytes, so a small deflate bomb from one
+client can't blow up into hundreds of MB inside the server.
+"""
+import base64
+import struct
+import zlib
+from typing import NamedTuple
+
+FRAME_VERSION = 1
+FLAG_DEFLATE = 0x01
+MAX_INFLATED_BYTES = 16 * 1024 * 1024
+
+_U8 = struct.Struct(">B")
+_U32 = struct.Struct(">I")
+
+
+class FrameError(ValueError):
+    pass
+
+
+class FrameHeader(NamedTuple):
+    type: str
+    mime: str
+    flags: int
+    offset: int     # where the payload starts
+    length: int     # payload length
+
+
+def pack_frame(msg_type: str, payload: bytes, mime: str = "", compress: bool = False) -> bytes:
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, 6)
+        flags |= FLAG_DEFLATE
+    t = msg_type.encode("ascii")
+    m = mime.encode("ascii")
+    if len(t) > 255 or len(m) > 255:
+        raise FrameError("type/mime too long")
+    return b"".join((
+        _U8.pack(FRAME_VERSION), _U8.pack(flags),
+        _U8.pack(len(t)), t,
+        _U8.pack(len(m)), m,
+        _U32.pack(len(payload)), payload,
+    ))
+
+
+def unpack_header(buf: bytes) -> FrameHeader:
+    try:
+        version, flags, tlen = buf[0], buf[1], buf[2]
+        pos = 3
+        msg_type = buf[pos:pos + tlen].decode("ascii")
+        pos += tlen
+        mlen = buf[pos]
+        pos += 1
+        mime = buf[pos:pos + mlen].decode("ascii")
+        pos += mlen
+        (length,) = _U32.unpack_from(buf, pos)
+        pos += _U32.size
+    except (IndexError, UnicodeDecodeError, struct.error) as e:
+        raise FrameError(f"malformed frame header: {e}")
+    if version != FRAME_VERSION:
+        raise FrameError(f"unsupported frame version {version}")
+    if not msg_type:
+        raise FrameError("missing message type")
+    if pos + length != len(buf):
+        raise FrameError("payload length mismatch")
+    return FrameHeader(msg_type, mime, flags, pos, length)
+
+
+def frame_payload(buf: bytes, header: FrameHeader, max_size: int = MAX_INFLATED_BYTES) -> bytes:
+    """Payload bytes, inflated if the frame was compressed (at most max_size bytes)."""
+    payload = buf[header.offset:header.offset + header.length]
+    if header.flags & FLAG_DEFLATE:
+        max_size = max(1, max_size)  # 0 would mean "no limit" to zlib
+        inflater = zlib.decompressobj()
+        try:
+            payload = inflater.decompress(payload, max_size)
+        except zlib.error as e:
+            raise FrameError(f"bad deflate payload: {e}")
+        if inflater.unconsumed_tail or (not inflater.eof and len(payload) >= max_size):
+            raise FrameError(f"inflated payload exceeds {max_size} bytes")
+        if not inflater.eof:
+            raise FrameError("bad deflate payload: truncated stream")
+    return payload
+
+
+def frame_to_json(buf: bytes, header: FrameHeader, max_size: int = MAX_INFLATED_BYTES) -> dict:
+    """Fallback for peers that only speak JSON: payload becomes a data URL."""
+    payload = frame_payload(buf, header, max_size)
+    mime = header.mime or "application/octet-stream"
+    return {"type": header.type, "dataUrl": f"data:{mime};base64,{base64.b64encode(payload).decode('ascii')}"}
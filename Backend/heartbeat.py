@@ -0,0 +1,107 @@
+"""
+One heartbeat loop for every WebSocket on this worker.
+
+Sockets sit in a timing wheel of `slots` buckets; each tick (interval / slots)
+the loop pings one bucket concurrently, so a socket is pinged once per
+interval and pings are spread evenly instead of thousands of independent
+sleep timers firing at random times.
+
+Dead-peer detection: once a socket has answered with a PONG it is tracked.
+Every ping it hasn't answered counts as missed (any inbound message also
+resets the count); after `max_missed` misses it is handed to on_dead so the
+caller can free its role slot and close it. Sockets that never sent a PONG
+(older clients) are only pinged, as before.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Set
+
+
+class HeartbeatScheduler:
+    def __init__(
+        self,
+        send_ping: Callable[[Hashable], Awaitable[None]],
+        on_dead: Callable[[Hashable], Awaitable[None]],
+        interval: float = 25.0,
+        slots: int = 50,
+        max_missed: int = 2,
+    ):
+        self.send_ping = send_ping
+        self.on_dead = on_dead
+        self.interval = interval
+        self.slots = max(1, slots)
+        self.tick = interval / self.slots
+        self.max_missed = max_missed
+
+        self._wheel: List[Set[Hashable]] = [set() for _ in range(self.slots)]
+        self._slot: Dict[Hashable, int] = {}     # socket -> bucket index
+        self._missed: Dict[Hashable, int] = {}   # pong-tracked sockets -> unanswered pings
+        self._cursor = 0
+        self.stats = {"pings": 0, "dead": 0}
+
+    def __len__(self) -> int:
+        return len(self._slot)
+
+    def register(self, sock: Hashable):
+        # The bucket just behind the cursor comes round last: first ping one interval from now
+        idx = (self._cursor - 1) % self.slots
+        self._wheel[idx].add(sock)
+        self._slot[sock] = idx
+
+    def unregister(self, sock: Hashable):
+        idx = self._slot.pop(sock, None)
+        if idx is not None:
+            self._wheel[idx].discard(sock)
+        self._missed.pop(sock, None)
+
+    def pong(self, sock: Hashable):
+        if sock in self._slot:
+            self._missed[sock] = 0
+
+    def seen(self, sock: Hashable):
+        if sock in self._missed:
+            self._missed[sock] = 0
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "sockets": len(self._slot),
+            "tracked": len(self._missed),
+            "interval_s": self.interval,
+            "slots": self.slots,
+        }
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_at = loop.time()
+        while True:
+            next_at += self.tick
+            await asyncio.sleep(max(0.0, next_at - loop.time()))
+
+            bucket = self._wheel[self._cursor]
+            self._cursor = (self._cursor + 1) % self.slots
+            if not bucket:
+                continue
+
+            alive, dead = [], []
+            for sock in list(bucket):
+                missed = self._missed.get(sock)
+                if missed is not None and missed >= self.max_missed:
+                    dead.append(sock)
+                    continue
+                if missed is not None:
+                    self._missed[sock] = missed + 1
+                alive.append(sock)
+
+            for sock in dead:
+                self.unregister(sock)
+            self.stats["pings"] += len(alive)
+            self.stats["dead"] += len(dead)
+
+            results = await asyncio.gather(
+                *(self.send_ping(s) for s in alive),
+                *(self.on_dead(s) for s in dead),
+                return_exceptions=True,
+            )
+            for r in results:
+                if isinstance(r, Exception):
+                    print(f"[heartbeat] callback failed: {r}")
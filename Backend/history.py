@@ -0,0 +1,91 @@
+"""
+Per-session history of edit results, so REFINE can start from a previous
+result by id instead of the kiosk uploading the pixels again.
+
+Bounded three ways:
+  - per session: at most `per_session_entries` results and `per_session_bytes`
+  - globally: `max_bytes` across all sessions (least recently used first)
+History for a session is dropped together with the session.
+"""
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+class ResultHistory:
+    def __init__(self, per_session_entries: int = 8, per_session_bytes: int = 32 * 1024 * 1024,
+                 max_bytes: int = 256 * 1024 * 1024):
+        self.per_session_entries = per_session_entries
+        self.per_session_bytes = per_session_bytes
+        self.max_bytes = max_bytes
+
+        # _sessions[sid] = OrderedDict(result_id -> (data, media_type)), oldest first
+        self._sessions: Dict[str, "OrderedDict[str, Tuple[bytes, str]]"] = {}
+        self._session_bytes: Dict[str, int] = {}
+        # global LRU over (sid, result_id)
+        self._lru: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._bytes = 0
+        self.stats = {"added": 0, "evicted": 0, "hits": 0, "misses": 0}
+
+    def add(self, sid: str, data: bytes, media_type: str) -> Optional[str]:
+        size = len(data)
+        if self.per_session_entries < 1 or size > self.per_session_bytes or size > self.max_bytes:
+            return None
+        rid = uuid.uuid4().hex[:12]
+        entries = self._sessions.setdefault(sid, OrderedDict())
+        entries[rid] = (data, media_type)
+        self._session_bytes[sid] = self._session_bytes.get(sid, 0) + size
+        self._lru[(sid, rid)] = size
+        self._bytes += size
+        self.stats["added"] += 1
+
+        while sid in self._sessions and (
+                len(entries) > self.per_session_entries or self._session_bytes[sid] > self.per_session_bytes):
+            self._remove(sid, next(iter(entries)))
+        while self._bytes > self.max_bytes:
+            self._remove(*next(iter(self._lru)))
+        return rid if (sid, rid) in self._lru else None
+
+    def get(self, sid: str, rid: str) -> Optional[Tuple[str, bytes, str]]:
+        """Look up a result; rid "last" means the most recent one. Returns (rid, data, media_type)."""
+        entries = self._sessions.get(sid)
+        if entries and rid == "last":
+            rid = next(reversed(entries))
+        hit = entries.get(rid) if entries else None
+        if hit is None:
+            self.stats["misses"] += 1
+            return None
+        self._lru.move_to_end((sid, rid))
+        self.stats["hits"] += 1
+        return rid, hit[0], hit[1]
+
+    def drop(self, sid: str):
+        for rid in list(self._sessions.get(sid, ())):
+            self._remove(sid, rid, evicted=False)
+
+    def sessions(self) -> List[str]:
+        return list(self._sessions)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "sessions": len(self._sessions),
+            "entries": len(self._lru),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _remove(self, sid: str, rid: str, evicted: bool = True):
+        entries = self._sessions.get(sid)
+        if not entries or rid not in entries:
+            return
+        data, _ = entries.pop(rid)
+        size = len(data)
+        self._lru.pop((sid, rid), None)
+        self._bytes -= size
+        self._session_bytes[sid] -= size
+        if not entries:
+            del self._sessions[sid]
+            del self._session_bytes[sid]
+        if evicted:
+            self.stats["evicted"] += 1
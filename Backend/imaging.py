@@ -0,0 +1,197 @@
+"""
+Image helpers for the edit pipeline (no FastAPI here, just PIL).
+"""
+import math
+import time
+import warnings
+from io import BytesIO
+from typing import Dict, NamedTuple, Optional, Sequence, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+UPLOAD_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+class PreparedImage(NamedTuple):
+    image: Optional[Image.Image]  # normalized RGB frame (None once it has left the worker pool)
+    data: bytes                   # encoded upload body
+    mime_type: str
+    original_size: tuple          # (w, h) before resize
+    size: tuple = ()              # (w, h) sent to the model
+    remote_uri: Optional[str] = None  # copy already in the provider's file store, if pre-uploaded
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+class UnsupportedImage(ValueError):
+    pass
+
+
+class CorruptImage(ValueError):
+    pass
+
+
+def open_upload(data: bytes, formats: Sequence[str], max_pixels: int, max_edge: int = 0) -> Image.Image:
+    """
+    Open an upload from its header only and check it before any pixel is
+    decoded: the format must be one of `formats` and width*height must not
+    exceed `max_pixels` (decompression-bomb guard). For JPEGs, also ask the
+    decoder to scale down by 1/2..1/8 while decoding when the frame is far
+    bigger than `max_edge`, so a 12MP capture never materializes at full size.
+    """
+    try:
+        with warnings.catch_warnings():
+            # Between 1x and 2x of the limit PIL only warns; we reject below
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            img = Image.open(BytesIO(data), formats=list(formats))
+    except Image.DecompressionBombError:
+        raise ImageTooLarge(f"more than {max_pixels} pixels")
+    except (UnidentifiedImageError, OSError):
+        raise UnsupportedImage(f"Not a supported image ({', '.join(formats)})")
+
+    w, h = img.size
+    if w <= 0 or h <= 0:
+        raise UnsupportedImage("image has no pixels")
+    if w * h > max_pixels:
+        raise ImageTooLarge(f"{w}x{h} is more than {max_pixels} pixels")
+
+    if img.format == "JPEG" and max_edge > 0 and max(w, h) > 2 * max_edge:
+        ratio = max_edge / max(w, h)
+        img.draft("RGB", (math.ceil(w * ratio), math.ceil(h * ratio)))
+    return img
+
+
+def prepare_upload(pil_image: Image.Image, max_edge: int, fmt: str = "JPEG", quality: int = 85) -> PreparedImage:
+    """
+    Normalize a kiosk capture before sending it to the model:
+      1. apply EXIF orientation (phones/tablets store rotated frames)
+      2. convert to RGB (drops PNG alpha from canvas.toDataURL)
+      3. downscale so the longest edge is <= max_edge (BILINEAR + reducing_gap,
+         which first does a cheap integer reduce on large frames)
+      4. re-encode as JPEG/WebP at the given quality
+    """
+    fmt = fmt.upper()
+    if fmt not in UPLOAD_MIME_TYPES:
+        raise ValueError(f"Unsupported upload format: {fmt}")
+
+    original_size = pil_image.size
+    img = ImageOps.exif_transpose(pil_image)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    if max_edge > 0 and max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), resample=Image.Resampling.BILINEAR, reducing_gap=2.0)
+
+    buf = BytesIO()
+    if fmt == "PNG":
+        img.save(buf, format="PNG")
+    else:
+        img.save(buf, format=fmt, quality=quality)
+    return PreparedImage(img, buf.getvalue(), UPLOAD_MIME_TYPES[fmt], original_size, img.size)
+
+
+def decode_and_prepare(data: bytes, formats: Sequence[str], max_pixels: int, max_edge: int,
+                       fmt: str = "JPEG", quality: int = 85) -> Tuple[PreparedImage, bytes, Dict[str, float]]:
+    """
+    The whole CPU-bound half of an upload in one call, so it can run in a
+    worker thread or process: open_upload + decode + prepare_upload + pixel
+    digest. Returns (prepared image without the decoded frame, pixel digest,
+    {"decode": s, "preprocess": s}); only compressed bytes travel back.
+    """
+    from edit_cache import pixel_digest
+
+    # Worker processes don't run main.py's module setup
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    started = time.perf_counter()
+    img = open_upload(data, formats, max_pixels, max_edge)
+    try:
+        img.load()
+    except OSError as e:
+        raise CorruptImage(f"Could not decode image: {e}")
+    decoded = time.perf_counter()
+    prepared = prepare_upload(img, max_edge, fmt, quality)
+    digest = pixel_digest(prepared.image)
+    timings = {"decode": decoded - started, "preprocess": time.perf_counter() - decoded}
+    return prepared._replace(image=None), digest, timings
+
+
+# ---------------- Result encoding ----------------
+# mime type -> PIL format name, for formats we can transcode results into
+RESULT_FORMATS = {
+    "image/png": "PNG",
+    "image/jpeg": "JPEG",
+    "image/webp": "WEBP",
+    "image/avif": "AVIF",
+}
+# ?format=... shorthands
+FORMAT_ALIASES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "webp": "image/webp", "avif": "image/avif"}
+
+
+def sniff_mime(data: bytes) -> Optional[str]:
+    """Identify an image from its magic bytes (cheap, no decode)."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp" and data[8:12] in (b"avif", b"avis"):
+        return "image/avif"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return None
+
+
+def can_encode(mime_type: str) -> bool:
+    fmt = RESULT_FORMATS.get(mime_type)
+    Image.init()  # populate Image.SAVE with every available plugin
+    return fmt is not None and fmt in Image.SAVE
+
+
+def negotiate_format(source_mime: str, accept: Optional[str], requested: Optional[str]) -> Optional[str]:
+    """
+    Pick the response type. Returns None for passthrough (send the model's
+    bytes untouched) or the mime type to transcode into.
+    An explicit ?format= wins; otherwise the Accept header is honoured only
+    when it rules out the source type.
+    """
+    if requested:
+        target = FORMAT_ALIASES.get(requested.lower(), requested.lower())
+        if not can_encode(target):
+            raise ValueError(f"Unsupported output format: {requested}")
+        return None if target == source_mime else target
+
+    if not accept:
+        return None
+    accepted = []
+    for item in accept.split(","):
+        media, *params = [p.strip() for p in item.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    pass
+        if q > 0:
+            accepted.append(media.lower())
+    if not accepted or source_mime in accepted or "*/*" in accepted or "image/*" in accepted:
+        return None
+    for media in accepted:
+        if can_encode(media):
+            return media
+    return None
+
+
+def transcode(data: bytes, target_mime: str, quality: int) -> bytes:
+    fmt = RESULT_FORMATS[target_mime]
+    img = Image.open(BytesIO(data))
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    buf = BytesIO()
+    if fmt == "PNG":
+        img.save(buf, format=fmt)
+    else:
+        img.save(buf, format=fmt, quality=quality)
+    return buf.getvalue()
@@ -1,26 +1,71 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException,WebSocket, WebSocketDisconnect
-from fastapi.responses import Response
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException,WebSocket, WebSocketDisconnect, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from google import genai
 from PIL import Image
-from io import BytesIO
 import os
+import json
 from dotenv import load_dotenv
-from typing import Literal, Tuple, Dict
+from typing import Literal, Tuple, Dict, List, Optional
+from collections import OrderedDict
 import asyncio
 import uuid
+import base64
 import tempfile
+import time
 import traceback
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
+from edit_cache import ResultCache, fingerprint
+from singleflight import SingleFlight
+from frames import FLAG_DEFLATE, MAX_INFLATED_BYTES, FrameError, unpack_header, frame_payload, frame_to_json, pack_frame
+from session_store import ROLES, SessionStore, SessionLimitError, InMemorySessionStore, RedisSessionStore
+from heartbeat import HeartbeatScheduler
+from sendqueue import SendQueue
+from metrics import Gauge, Registry, ServerTiming, StageTimer
+from history import ResultHistory
+from result_store import ResultStore
+from providers import ProviderError, build_provider
+from scheduler import ModelScheduler, DeadlineExceeded, UpstreamBusy, PRIORITY_INTERACTIVE, PRIORITY_BATCH
+from uploads import UploadLimit, read_upload
+from workpool import ImagePool
+from imaging import open_upload, decode_and_prepare, ImageTooLarge, UnsupportedImage, CorruptImage, PreparedImage, negotiate_format, transcode, FORMAT_ALIASES, can_encode
 
 # Load environment variables (e.g., your Gemini API key)
 load_dotenv()
 
-# --- RECOMMENDED API KEY CONFIGURATION ---
-# Create a Client instance, which will handle authentication.
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+# ---------------- Edit provider ----------------
+# EDIT_PROVIDER=gemini (default) or stub for offline load tests, see providers.py
+EDIT_PROVIDER = os.getenv("EDIT_PROVIDER", "gemini")
+provider = build_provider(
+    EDIT_PROVIDER,
+    api_key=os.getenv("GEMINI_API_KEY"),
+    model=os.getenv("GEMINI_MODEL", "gemini-2.5-flash-image-preview"),
+    latency_s=float(os.getenv("STUB_LATENCY_S", "2.0")),
+    jitter_s=float(os.getenv("STUB_JITTER_S", "0.5")),
+    error_rate=float(os.getenv("STUB_ERROR_RATE", "0")),
+)
+print(f"[provider] {provider.name} ({provider.model})")
+# Warm the provider (SDK import, client, first connection) in the background
+# at startup; PROVIDER_WARMUP=0 leaves it all to the first edit.
+PROVIDER_WARMUP = os.getenv("PROVIDER_WARMUP", "1") == "1"
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # startup()/shutdown() live next to the session store, further down
+    await startup()
+    try:
+        yield
+    finally:
+        await shutdown()
+
+app = FastAPI(lifespan=lifespan)
+
+# ---------------- Upload size limit ----------------
+# Oversized bodies get 413 while still streaming in, not after being buffered.
+# The extra 64KB leaves room for the multipart envelope and form fields.
+# Registered before CORS so CORS wraps it: the browser can read the early 413.
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+app.add_middleware(UploadLimit, max_body_bytes=UPLOAD_MAX_BYTES + 64 * 1024, paths=("/api/edit", "/api/jobs", "/api/captures"))
 
 # ---------------- CORS ----------------
 def build_allowed_origins() -> list[str]:
@@ -29,6 +74,8 @@ def build_allowed_origins() -> list[str]:
     return items
 
 ALLOWED_ORIGINS = build_allowed_origins()
+# Custom response headers the kiosk is allowed to read from fetch()
+EXPOSED_HEADERS = ["X-Cache", "X-Result-Id", "X-Result-Url", "X-Draft-Id", "Retry-After", "Server-Timing", "ETag", "Content-Range"]
 ALLOW_RENDER_REGEX = os.getenv("CORS_ALLOW_RENDER_REGEX", "false").lower() == "true"
 DEBUG_CORS = os.getenv("DEBUG_CORS", "false").lower() == "true"
 
@@ -40,6 +87,7 @@ if DEBUG_CORS:
         allow_credentials=False,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=EXPOSED_HEADERS,
     )
 else:
     if ALLOW_RENDER_REGEX:
@@ -51,6 +99,7 @@ else:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=EXPOSED_HEADERS,
         )
     else:
         print("[CORS] Allowed origins:", ALLOWED_ORIGINS)
@@ -60,47 +109,915 @@ else:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=EXPOSED_HEADERS,
+        )
+
+# ---------------- Metrics ----------------
+# Prometheus text at GET /metrics (per worker). Edit stages are also returned
+# to the caller as a Server-Timing header so kiosk traces line up with ours.
+metrics = Registry()
+edit_stage_seconds = metrics.histogram(
+    "imgmod_edit_stage_seconds",
+    "Time per edit stage: read, decode, preprocess, model (incl. queueing), upstream (provider call), encode",
+    ["stage"],
+)
+http_request_seconds = metrics.histogram("imgmod_http_request_seconds", "HTTP request time until headers are sent", ["route"])
+http_responses_total = metrics.counter("imgmod_http_responses_total", "HTTP responses", ["route", "status"])
+errors_total = metrics.counter("imgmod_errors_total", "Errors by class", ["kind"])
+cache_requests_total = metrics.counter("imgmod_cache_requests_total", "Edit lookups by outcome", ["result"])
+bytes_total = metrics.counter(
+    "imgmod_bytes_total",
+    "Bytes by direction: upload (from clients), model_in (to the model), model_out, response (to clients)",
+    ["direction"],
+)
+relay_messages_total = metrics.counter("imgmod_relay_messages_total", "WebSocket messages relayed", ["kind"])
+relay_bytes_total = metrics.counter("imgmod_relay_bytes_total", "WebSocket payload size relayed (characters for text frames)", ["kind"])
+ws_send_dropped_total = metrics.counter(
+    "imgmod_ws_send_dropped_total",
+    "Outbound WebSocket messages not sent: overflow (oldest dropped), coalesced (superseded status), disconnect",
+    ["reason"],
+)
+live_gauge = metrics.gauge("imgmod_live", "Live objects on this worker (sessions are store-wide)", ["what"])
+model_gauge = metrics.gauge("imgmod_model_scheduler", "Model scheduler state", ["what"])
+session_gauge = metrics.gauge("imgmod_session_store", "Sessions expired / evicted / rejected by this worker", ["what"])
+result_store_gauge = metrics.gauge("imgmod_result_store", "Result store state", ["what"])
+image_pool_gauge = metrics.gauge("imgmod_image_pool", "Image pool state", ["what"])
+
+def set_gauges(gauge: Gauge, snapshot: dict):
+    """One sample per numeric field of a stats snapshot, labelled with its name."""
+    for what, value in snapshot.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            gauge.set(value, what=what)
+
+stage_timer = StageTimer(edit_stage_seconds)
+
+app.add_middleware(ServerTiming, timer=stage_timer, request_seconds=http_request_seconds, responses=http_responses_total)
+
+# ---------------- Gemini: scheduled async calls ----------------
+# Max Gemini calls in flight per worker; extra edits wait in line instead of
+# piling onto the upstream API.
+GEMINI_MAX_INFLIGHT = max(1, int(os.getenv("GEMINI_MAX_INFLIGHT", "4")))
+# Token bucket matched to the project's quota (0 = no rate limit)
+GEMINI_RATE_PER_S = float(os.getenv("GEMINI_RATE_PER_S", "0"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", str(GEMINI_MAX_INFLIGHT)))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+GEMINI_RETRY_BASE_S = float(os.getenv("GEMINI_RETRY_BASE_S", "1"))
+GEMINI_RETRY_MAX_S = float(os.getenv("GEMINI_RETRY_MAX_S", "20"))
+# How long an edit may wait + run before giving up, per priority class
+EDIT_DEADLINE_S = float(os.getenv("EDIT_DEADLINE_S", "90"))
+BATCH_DEADLINE_S = float(os.getenv("BATCH_DEADLINE_S", "240"))
+
+model_scheduler = ModelScheduler(
+    max_inflight=GEMINI_MAX_INFLIGHT,
+    rate=GEMINI_RATE_PER_S,
+    burst=GEMINI_BURST,
+    max_retries=GEMINI_MAX_RETRIES,
+    backoff_base=GEMINI_RETRY_BASE_S,
+    backoff_max=GEMINI_RETRY_MAX_S,
+    is_retryable=provider.is_retryable,
+)
+
+async def generate_content_async(prompt: str, image: PreparedImage, priority: int = PRIORITY_INTERACTIVE,
+                                 deadline_s: float = EDIT_DEADLINE_S) -> Tuple[bytes, str]:
+    """
+    Run one provider call (async all the way down, so the event loop keeps
+    serving WebSockets and /ping while the model works).
+    The call goes through model_scheduler: concurrency cap, quota rate limit,
+    priority order, deadline and retries on 429/503. Those failures come back
+    as 503 (busy, with Retry-After) or 504 (deadline) instead of a generic 500.
+    """
+    async def attempt():
+        with stage_timer.stage("upstream"):
+            return await provider.edit(prompt, image)
+
+    try:
+        result, media_type = await model_scheduler.call(attempt, priority=priority, timeout=deadline_s)
+    except DeadlineExceeded as e:
+        errors_total.inc(kind="deadline")
+        raise HTTPException(status_code=504, detail=f"Model call timed out: {e}")
+    except UpstreamBusy as e:
+        errors_total.inc(kind="upstream_busy")
+        raise HTTPException(
+            status_code=503,
+            detail="Image model is over capacity, try again shortly",
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        )
+    bytes_total.inc(len(image.data), direction="model_in")
+    bytes_total.inc(len(result), direction="model_out")
+    return result, media_type
+
+# ---------------- Result cache ----------------
+# Identical image + prompt + model -> same result; skip the paid Gemini call.
+edit_cache = ResultCache(
+    max_bytes=int(os.getenv("EDIT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    disk_dir=os.getenv("EDIT_CACHE_DIR") or None,
+    disk_max_bytes=int(os.getenv("EDIT_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024))),
+)
+
+# ---------------- Input preprocessing ----------------
+# Kiosk captures arrive as full-resolution PNGs; the model doesn't need that.
+UPLOAD_MAX_EDGE = int(os.getenv("UPLOAD_MAX_EDGE", "1536"))
+UPLOAD_FORMAT = os.getenv("UPLOAD_FORMAT", "JPEG").upper()   # JPEG | WEBP
+UPLOAD_QUALITY = int(os.getenv("UPLOAD_QUALITY", "85"))
+
+# Ingestion limits, enforced before anything is decoded (UPLOAD_MAX_BYTES is
+# next to the UploadLimit middleware, above)
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", str(40_000_000)))
+UPLOAD_ACCEPTED_FORMATS = [
+    f.strip().upper() for f in os.getenv("UPLOAD_ACCEPTED_FORMATS", "JPEG,PNG,WEBP").split(",") if f.strip()
+]
+# PIL's own decompression-bomb check (warns above, refuses above 2x)
+Image.MAX_IMAGE_PIXELS = UPLOAD_MAX_PIXELS
+
+# Decode/resize/re-encode/transcode run off the event loop (see workpool.py):
+# IMAGE_POOL=thread (default) | process | inline
+IMAGE_POOL = os.getenv("IMAGE_POOL", "thread").lower()
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+image_pool = ImagePool(IMAGE_POOL, IMAGE_POOL_WORKERS)
+
+upload_stats = {"count": 0, "bytes_in": 0, "bytes_out": 0, "last_bytes_in": 0, "last_bytes_out": 0}
+
+def record_upload(bytes_in: int, bytes_out: int):
+    upload_stats["count"] += 1
+    upload_stats["bytes_in"] += bytes_in
+    upload_stats["bytes_out"] += bytes_out
+    upload_stats["last_bytes_in"] = bytes_in
+    upload_stats["last_bytes_out"] = bytes_out
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    live_gauge.set(await session_store.count(), what="sessions")
+    live_gauge.set(len(rooms), what="rooms")
+    live_gauge.set(len(heartbeat), what="sockets")
+    outboxes = _outboxes()
+    live_gauge.set(sum(len(q) for _, _, q in outboxes), what="ws_queued")
+    live_gauge.set(max((len(q) for _, _, q in outboxes), default=0), what="ws_queue_max_depth")
+    live_gauge.set(len(jobs), what="jobs")
+    live_gauge.set(len(edit_flights), what="edits_inflight")
+    sched = model_scheduler.snapshot()
+    for what in ("queued", "inflight", "tokens"):
+        model_gauge.set(sched[what], what=what)
+    set_gauges(session_gauge, session_store.stats)
+    set_gauges(result_store_gauge, result_store.snapshot())
+    set_gauges(image_pool_gauge, image_pool.snapshot())
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/stats")
+async def stats():
+    return {
+        "provider": {"name": provider.name, "model": provider.model},
+        "gemini": model_scheduler.snapshot(),
+        "image_pool": image_pool.snapshot(),
+        "upload": {
+            **upload_stats,
+            "max_edge": UPLOAD_MAX_EDGE,
+            "format": UPLOAD_FORMAT,
+            "quality": UPLOAD_QUALITY,
+        },
+        "cache": edit_cache.snapshot(),
+        "coalescing": {**edit_flights.stats, "inflight": len(edit_flights)},
+        "heartbeat": heartbeat.snapshot(),
+        "send_queues": _send_queue_stats(),
+        "history": result_history.snapshot(),
+        "result_store": result_store.snapshot(),
+        "jobs": {**job_stats, "live": len(jobs), "max_bytes": JOB_MAX_BYTES, "max_finished": JOB_MAX_FINISHED},
+        "drafts": {**draft_stats, "live": len(drafts)},
+        "captures": {**capture_stats, "live": len(captures)},
+        "cancellations": {**cancel_stats, "sessions_with_edits": len(session_edits)},
+        "sessions": {
+            "backend": session_store.name,
+            "live": await session_store.count(),
+            "max_live": SESSION_MAX_LIVE,
+            "local_rooms": len(rooms),
+            **session_store.stats,
+        },
+    }
+
+# Concurrent identical edits (double-taps, kiosks sharing a preset) share one
+# Gemini call, keyed on the same fingerprint as the cache.
+edit_flights = SingleFlight()
+
+async def run_edit(cache_key: str, prepared: PreparedImage, prompt: str,
+                   priority: int = PRIORITY_INTERACTIVE, deadline_s: float = EDIT_DEADLINE_S) -> Tuple[bytes, str]:
+    """
+    Cache miss path: call the provider, keep its image as-is and store it in
+    the cache. Returns (bytes, media_type).
+    """
+    print("**********************",prompt)
+
+    # Async client + scheduler: the event loop stays free while we wait
+    try:
+        result, media_type = await generate_content_async(prompt, prepared, priority, deadline_s)
+    except ProviderError as e:
+        errors_total.inc(kind="no_image")
+        raise HTTPException(status_code=500, detail=str(e))
+    print("after gemini")
+
+    await edit_cache.put(cache_key, result, media_type)
+    return result, media_type
+
+# ---------------- Result encoding ----------------
+# Results go out exactly as Gemini returned them unless the client asks for
+# another format (?format=webp&quality=80 or an Accept header).
+RESULT_QUALITY = int(os.getenv("RESULT_QUALITY", "85"))
+
+async def encode_response(data: bytes, media_type: str, accept: Optional[str], fmt: Optional[str],
+                          quality: Optional[int], headers: Dict[str, str]) -> Response:
+    with stage_timer.stage("encode"):
+        target = negotiate_format(media_type, accept, fmt)
+        if target is not None:
+            data = await image_pool.run(transcode, data, target, quality or RESULT_QUALITY)
+            media_type = target
+    bytes_total.inc(len(data), direction="response")
+    return Response(content=data, media_type=media_type, headers={**headers, "Vary": "Accept"})
+
+EDIT_PROMPT_PREFIX = "Maintain the subject's face and facial identity. Change the background of the image as per the following prompt: "
+
+def check_output_params(format: Optional[str], quality: Optional[int]):
+    if format and not can_encode(FORMAT_ALIASES.get(format.lower(), format.lower())):
+        raise HTTPException(status_code=400, detail=f"Unsupported output format: {format}")
+    if quality is not None and not 1 <= quality <= 100:
+        raise HTTPException(status_code=400, detail="quality must be between 1 and 100")
+
+def open_checked(image_bytes: bytes, max_edge: int = UPLOAD_MAX_EDGE) -> Image.Image:
+    """Header-only validation (format, dimensions) of an upload; nothing decoded yet."""
+    try:
+        return open_upload(image_bytes, UPLOAD_ACCEPTED_FORMATS, UPLOAD_MAX_PIXELS, max_edge)
+    except ImageTooLarge as e:
+        errors_total.inc(kind="upload_too_large")
+        raise HTTPException(status_code=413, detail=f"Image too large: {e}")
+    except UnsupportedImage as e:
+        errors_total.inc(kind="upload_unsupported")
+        raise HTTPException(status_code=415, detail=str(e))
+
+async def prepare_source(image_bytes: bytes, max_edge: int = UPLOAD_MAX_EDGE,
+                         quality: int = UPLOAD_QUALITY, capture: Optional[dict] = None) -> Tuple[PreparedImage, bytes]:
+    """
+    Decode + preprocess an uploaded capture once, in the image pool.
+    Returns (prepared image, pixel digest for cache keys).
+    A capture staged by POST /api/captures was prepared with the default
+    settings already and is reused as-is.
+    """
+    if capture is not None and (max_edge, quality) == (UPLOAD_MAX_EDGE, UPLOAD_QUALITY):
+        return capture["prepared"], capture["digest"]
+    try:
+        prepared, digest, timings = await image_pool.run(
+            decode_and_prepare, image_bytes, UPLOAD_ACCEPTED_FORMATS, UPLOAD_MAX_PIXELS,
+            max_edge, UPLOAD_FORMAT, quality,
+        )
+    except ImageTooLarge as e:
+        errors_total.inc(kind="upload_too_large")
+        raise HTTPException(status_code=413, detail=f"Image too large: {e}")
+    except UnsupportedImage as e:
+        errors_total.inc(kind="upload_unsupported")
+        raise HTTPException(status_code=415, detail=str(e))
+    except CorruptImage as e:
+        errors_total.inc(kind="upload_corrupt")
+        raise HTTPException(status_code=400, detail=str(e))
+    for stage, seconds in timings.items():
+        stage_timer.record(stage, seconds)
+    record_upload(len(image_bytes), len(prepared.data))
+    print(
+        f"[upload] {prepared.original_size[0]}x{prepared.original_size[1]} {len(image_bytes)}B -> "
+        f"{prepared.size[0]}x{prepared.size[1]} {len(prepared.data)}B {prepared.mime_type}"
+    )
+
+    # Key on the normalized pixels, so preprocessing settings are part of it
+    return prepared, digest
+
+def compose_edit(digest: bytes, prompt: str) -> Tuple[str, str]:
+    """Final prompt and cache key for one prompt against a prepared source."""
+    prompt = EDIT_PROMPT_PREFIX + prompt
+    return prompt, fingerprint(None, prompt, provider.model, digest=digest)
+
+async def prepare_edit(image_bytes: bytes, prompt: str, max_edge: int = UPLOAD_MAX_EDGE,
+                       quality: int = UPLOAD_QUALITY, capture: Optional[dict] = None) -> Tuple[PreparedImage, str, str]:
+    """
+    Decode + preprocess an uploaded capture and compose the final prompt.
+    Returns (prepared image, full prompt, cache key).
+    """
+    prepared, digest = await prepare_source(image_bytes, max_edge, quality, capture)
+    prompt, cache_key = compose_edit(digest, prompt)
+    return prepared, prompt, cache_key
+
+async def edit_or_cached(cache_key: str, prepared: PreparedImage, prompt: str,
+                         priority: int = PRIORITY_INTERACTIVE,
+                         deadline_s: float = EDIT_DEADLINE_S) -> Tuple[bytes, str, str]:
+    """
+    Cache, then single-flight, then Gemini.
+    Returns (bytes, media_type, source) with source HIT | COALESCED | MISS.
+    A coalesced caller rides on the leader's priority and deadline.
+    """
+    cached = await edit_cache.get(cache_key)
+    if cached is not None:
+        print(f"[cache] hit {cache_key[:12]}")
+        cache_requests_total.inc(result="HIT")
+        return cached[0], cached[1], "HIT"
+
+    with stage_timer.stage("model"):
+        (data, media_type), shared = await edit_flights.do(
+            cache_key, lambda: run_edit(cache_key, prepared, prompt, priority, deadline_s)
         )
+    if shared:
+        print(f"[edit] coalesced onto in-flight {cache_key[:12]}")
+    source = "COALESCED" if shared else "MISS"
+    cache_requests_total.inc(result=source)
+    return data, media_type, source
+
+# ---------------- Session edit history ----------------
+# Results of edits made with a `session` are kept server-side, so a refinement
+# can say base_result=<id>|last instead of re-uploading the previous result.
+# Dropped together with the session.
+result_history = ResultHistory(
+    per_session_entries=int(os.getenv("HISTORY_MAX_ENTRIES", "8")),
+    per_session_bytes=int(os.getenv("HISTORY_SESSION_MAX_BYTES", str(32 * 1024 * 1024))),
+    max_bytes=int(os.getenv("HISTORY_MAX_BYTES", str(256 * 1024 * 1024))),
+)
+
+async def resolve_source(image_file: Optional[UploadFile], session: Optional[str],
+                         base_result: Optional[str]) -> bytes:
+    """Input pixels for an edit: a fresh upload, or a previous result of this session."""
+    if session is not None and not await session_store.exists(session):
+        raise HTTPException(status_code=404, detail="Invalid session")
+    if base_result:
+        if session is None:
+            raise HTTPException(status_code=400, detail="base_result requires session")
+        hit = result_history.get(session, base_result)
+        if hit is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired result for this session")
+        print(f"[history] {session} refining from {hit[0]}")
+        return hit[1]
+    if image_file is None:
+        raise HTTPException(status_code=400, detail="image_file or base_result is required")
+    with stage_timer.stage("read"):
+        data = await read_upload(image_file, UPLOAD_MAX_BYTES)
+    bytes_total.inc(len(data), direction="upload")
+    return data
+
+async def resolve_input(image_file: Optional[UploadFile], session: Optional[str], base_result: Optional[str],
+                        capture: Optional[str]) -> Tuple[bytes, Optional[dict]]:
+    """resolve_source(), or a capture staged by POST /api/captures: (source bytes, staged capture or None)."""
+    if capture:
+        staged = use_capture(capture, session)
+        return staged["source"], staged
+    return await resolve_source(image_file, session, base_result), None
+
+# ---------------- Result store ----------------
+# Every finished result is also written to a content-addressed file store and
+# served by GET /api/results/{sha256} (X-Result-Url), so displays, downloads and
+# QR/print flows fetch the file instead of re-running or re-relaying the edit.
+RESULT_STORE_DIR = os.getenv("RESULT_STORE_DIR") or os.path.join(tempfile.gettempdir(), "imgmod-results")
+result_store = ResultStore(
+    RESULT_STORE_DIR,
+    max_bytes=int(os.getenv("RESULT_STORE_MAX_BYTES", str(1024 * 1024 * 1024))),
+    max_age_s=float(os.getenv("RESULT_STORE_MAX_AGE_S", str(24 * 3600))),
+)
+
+async def remember_result(session: Optional[str], data: bytes, media_type: str) -> Dict[str, str]:
+    """Persist a result (and add it to the session's history); returns X-Result-Url / X-Result-Id headers."""
+    headers = {}
+    try:
+        headers["X-Result-Url"] = f"/api/results/{await result_store.put(data, media_type)}"
+    except OSError as e:
+        errors_total.inc(kind="result_store")
+        print(f"[results] store failed: {e}")
+    if session is not None:
+        rid = result_history.add(session, data, media_type)
+        if rid:
+            headers["X-Result-Id"] = rid
+    return headers
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    # If-None-Match uses weak comparison
+    return "*" in tags or etag in [t[2:] if t.startswith("W/") else t for t in tags]
+
+@app.api_route("/api/results/{result_id}", methods=["GET", "HEAD"])
+def get_result(result_id: str, request: Request, download: bool = False):
+    """
+    A stored result, byte-for-byte as the edit returned it. The id is the
+    sha256 of the content: strong ETag, If-None-Match -> 304, Range requests,
+    and cacheable forever. ?download=1 adds Content-Disposition: attachment.
+    Range/If-Range (206, 416) come from Starlette's FileResponse, which has
+    them since Starlette 0.39 (FastAPI 0.115.3+, see requirements.txt).
+    """
+    stored = result_store.get(result_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired result")
+    etag = f'"{stored.id}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    filename = f"result-{stored.id[:12]}.{stored.path.rsplit('.', 1)[-1]}" if download else None
+    return FileResponse(stored.path, media_type=stored.media_type, headers=headers,
+                        stat_result=stored.stat, filename=filename)
+
+# ---------------- Cancellation ----------------
+# Edits nobody will read are cancelled: the HTTP client disconnected, a newer
+# edit (or a tablet EDIT/REFINE) for the same session superseded it, or the
+# kiosk left. Cancelling the edit task unwinds single-flight (the last waiter
+# cancels the shared call) and the scheduler (queue entry dropped, slot freed)
+# immediately. Tracking is per worker.
+SUPERSEDING_MESSAGES = {"EDIT", "REFINE", "OPEN_CAMERA"}
+
+# session_edits[sessionId] = {edit tasks in flight for that session}
+session_edits: Dict[str, set] = {}
+cancel_stats = {"disconnect": 0, "superseded": 0, "kiosk_left": 0}
+cancellations_total = metrics.counter("imgmod_cancellations_total", "Edits cancelled before completion", ["reason"])
+
+def _count_cancel(reason: str, n: int = 1):
+    if n:
+        cancel_stats[reason] += n
+        cancellations_total.inc(n, reason=reason)
+
+def track_edit(session: Optional[str], task: asyncio.Task):
+    """Register a session's edit; older edits of the same session are superseded."""
+    if session is None:
+        return
+    cancel_session_edits(session, "superseded")
+    tasks = session_edits.setdefault(session, set())
+    tasks.add(task)
+
+    def _done(t):
+        tasks.discard(t)
+        if not tasks and session_edits.get(session) is tasks:
+            session_edits.pop(session, None)
+    task.add_done_callback(_done)
+
+def cancel_session_edits(session: str, reason: str) -> int:
+    cancelled = 0
+    for task in list(session_edits.get(session, ())):
+        if not task.done():
+            task.cancel()
+            cancelled += 1
+    _count_cancel(reason, cancelled)
+    if cancelled:
+        print(f"[cancel] {cancelled} edit(s) of {session}: {reason}")
+    return cancelled
+
+async def _wait_disconnect(request: Request):
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+async def run_cancellable(request: Request, session: Optional[str], coro):
+    """
+    Run an edit as its own task, racing it against the client disconnecting.
+    Superseded edits answer 409; a vanished client gets 499 (nobody reads it).
+    """
+    task = asyncio.ensure_future(coro)
+    track_edit(session, task)
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+
+    if not task.done():
+        task.cancel()
+        _count_cancel("disconnect")
+        print(f"[cancel] client went away (session={session})")
+        raise HTTPException(status_code=499, detail="Client closed request")
+    if task.cancelled():
+        raise HTTPException(status_code=409, detail="Superseded by a newer edit")
+    return task.result()
+
 @app.post("/api/edit")
 
 async def process_image_with_gemini(
-    image_file: UploadFile = File(...),
-    prompt: str = Form(...)
+    request: Request,
+    image_file: Optional[UploadFile] = File(None),
+    prompt: str = Form(...),
+    session: Optional[str] = Form(None),
+    base_result: Optional[str] = Form(None),
+    capture: Optional[str] = Form(None),
+    format: Optional[str] = None,
+    quality: Optional[int] = None,
+    preview: bool = False,
+    accept: Optional[str] = Header(None),
 ):
+    """
+    ?preview=1 edits a small copy of the input and answers with X-Draft-Id;
+    the full-resolution edit only runs if that draft is confirmed.
+    capture=<captureId> (from POST /api/captures) replaces image_file.
+    """
     print("into gemini")
+    check_output_params(format, quality)
+    image_bytes, staged = await resolve_input(image_file, session, base_result, capture)
+
+    async def edit() -> Response:
+        if preview:
+            prepared, full_prompt, cache_key = await prepare_edit(image_bytes, prompt, PREVIEW_MAX_EDGE, PREVIEW_QUALITY)
+            data, media_type, source = await edit_or_cached(cache_key, prepared, full_prompt)
+            headers = {"X-Cache": source, "X-Draft-Id": create_draft(image_bytes, prompt, session)}
+            return await encode_response(data, media_type, accept, format, quality, headers)
+
+        prepared, full_prompt, cache_key = await prepare_edit(image_bytes, prompt, capture=staged)
+        data, media_type, source = await edit_or_cached(cache_key, prepared, full_prompt)
+        headers = {"X-Cache": source, **await remember_result(session, data, media_type)}
+        return await encode_response(data, media_type, accept, format, quality, headers)
+
     try:
-        image_bytes = await image_file.read()
-        pil_image = Image.open(BytesIO(image_bytes))
-        prompt= "Maintain the subject's face and facial identity. Change the background of the image as per the following prompt: " + prompt
+        return await run_cancellable(request, session, edit())
 
-        contents = [prompt, pil_image]
-        print("**********************",prompt)
+    except HTTPException:
+        raise
+    except Exception as e:
+        errors_total.inc(kind=type(e).__name__)
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+       
 
-        # Use the client to access the models service
-        response = client.models.generate_content(
-            model="gemini-2.5-flash-image-preview", 
-            contents=contents,
-        )
-        print("after gemini")
+# ---------------- Batch edits ----------------
+# One capture, several prompts: the image is decoded, preprocessed and hashed
+# once, the Gemini calls run concurrently at batch priority (behind interactive
+# edits, still under the scheduler's concurrency and rate limits),
+# and each variant is streamed back as one NDJSON line as soon as it finishes,
+# in completion order.
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "8"))
 
+@app.post("/api/edit/batch")
+async def batch_edit(
+    image_file: Optional[UploadFile] = File(None),
+    prompts: List[str] = Form(...),
+    session: Optional[str] = Form(None),
+    base_result: Optional[str] = Form(None),
+    capture: Optional[str] = Form(None),
+    format: Optional[str] = None,
+    quality: Optional[int] = None,
+):
+    """
+    Stream of application/x-ndjson lines, one per prompt:
+      {"index", "prompt", "cache", "mediaType", "resultId", "fileUrl", "dataUrl"}
+    or {"index", "prompt", "error"} if that variant failed. Only dataUrl is
+    converted to ?format; resultId and fileUrl keep the model's original bytes.
+    """
+    check_output_params(format, quality)
+    prompts = [p for p in (p.strip() for p in prompts) if p]
+    if not prompts:
+        raise HTTPException(status_code=400, detail="At least one prompt is required")
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_PROMPTS} prompts per batch")
 
-        result_image_data = None
-        for part in response.candidates[0].content.parts:
-            if part.inline_data is not None:
-                pil_image = Image.open(BytesIO(part.inline_data.data))
-                
-                # Create an in-memory buffer (BytesIO)
-                img_byte_arr = BytesIO()
-                pil_image.save(img_byte_arr, format="PNG")
-                img_byte_arr.seek(0)
+    image_bytes, staged = await resolve_input(image_file, session, base_result, capture)
+    try:
+        prepared, digest = await prepare_source(image_bytes, capture=staged)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not decode image: {e}")
+    print(f"[batch] {len(prompts)} prompts, session={session}")
+
+    async def variant(index: int, text: str) -> dict:
+        try:
+            prompt, cache_key = compose_edit(digest, text)
+            data, media_type, source = await edit_or_cached(
+                cache_key, prepared, prompt, PRIORITY_BATCH, BATCH_DEADLINE_S
+            )
+            # Store what the model returned, like /api/edit; only the streamed copy is transcoded
+            stored = await remember_result(session, data, media_type)
+            target = negotiate_format(media_type, None, format)
+            if target is not None:
+                data = await image_pool.run(transcode, data, target, quality or RESULT_QUALITY)
+                media_type = target
+            return {
+                "index": index,
+                "prompt": text,
+                "cache": source,
+                "mediaType": media_type,
+                "resultId": stored.get("X-Result-Id"),
+                "fileUrl": stored.get("X-Result-Url"),
+                "dataUrl": f"data:{media_type};base64,{base64.b64encode(data).decode('ascii')}",
+            }
+        except Exception as e:
+            if not isinstance(e, HTTPException):
+                errors_total.inc(kind=type(e).__name__)
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"[batch] variant {index} failed: {detail}")
+            return {"index": index, "prompt": text, "error": detail}
+
+    async def stream():
+        tasks = [asyncio.ensure_future(variant(i, p)) for i, p in enumerate(prompts)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away: stop the variants nobody will read
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# ---------------- Jobs: edits with progress pushed over the session WS ----------------
+# Submit returns a job id right away; progress goes to both peers in the room as
+#   {type:"JOB_STATUS", jobId, status:"QUEUED|UPLOADING|GENERATING|DONE|ERROR|CANCELLED", ...}
+# and the result is fetched once from GET /api/jobs/{jobId}/result.
+# Finished jobs keep their result for JOB_TTL_S, within JOB_MAX_BYTES /
+# JOB_MAX_FINISHED per worker (oldest finished job dropped first).
+JOB_TTL_S = float(os.getenv("JOB_TTL_S", "600"))
+JOB_MAX_BYTES = int(os.getenv("JOB_MAX_BYTES", str(128 * 1024 * 1024)))
+JOB_MAX_FINISHED = int(os.getenv("JOB_MAX_FINISHED", "256"))
 
-                return Response(content=img_byte_arr.getvalue(), media_type="image/png")
-        
-        raise HTTPException(status_code=500, detail="No image found in Gemini API response.")
+# jobs[jobId] = {"id", "session", "status", "data", "media_type", "cache", "error", "task", "result_id",
+#                "finished"}, oldest first; "finished" is set once the job's task is done
+jobs: Dict[str, dict] = {}
+job_stats = {"finished": 0, "expired": 0, "evicted": 0, "bytes": 0}
 
+def drop_job(job_id: str, outcome: str = "expired"):
+    job = jobs.pop(job_id, None)
+    if job is not None:
+        if job["data"] is not None:
+            job_stats["bytes"] -= len(job["data"])
+        job_stats[outcome] += 1
+
+def evict_jobs():
+    # Only jobs whose task has fully finished: a DONE job may still be broadcasting
+    finished = [j["id"] for j in jobs.values() if j["finished"]]
+    # Always keep the newest one, whatever its size
+    for job_id in finished[:-1]:
+        if job_stats["bytes"] <= JOB_MAX_BYTES and len(finished) <= JOB_MAX_FINISHED:
+            break
+        drop_job(job_id, "evicted")
+        finished.remove(job_id)
+
+async def _job_status(job: dict, status: str, **extra):
+    job["status"] = status
+    if job["session"]:
+        await _broadcast(job["session"], {"type": "JOB_STATUS", "jobId": job["id"], "status": status, **extra},
+                         status=True)
+
+async def _run_job(job: dict, image_bytes: bytes, prompt: str, capture: Optional[dict] = None):
+    try:
+        await _job_status(job, "UPLOADING")
+        prepared, prompt, cache_key = await prepare_edit(image_bytes, prompt, capture=capture)
+        del image_bytes
+
+        await _job_status(job, "GENERATING")
+        data, media_type, source = await edit_or_cached(cache_key, prepared, prompt)
+        job.update(data=data, media_type=media_type, cache=source)
+        job_stats["bytes"] += len(data)
+        stored = await remember_result(job["session"], data, media_type)
+        job.update(result_id=stored.get("X-Result-Id"), file_url=stored.get("X-Result-Url"))
+        await _job_status(
+            job, "DONE",
+            resultUrl=f"/api/jobs/{job['id']}/result",
+            resultId=job["result_id"],
+            fileUrl=job["file_url"],
+            mediaType=media_type,
+            bytes=len(data),
+        )
+    except asyncio.CancelledError:
+        job["error"] = "cancelled"
+        await _job_status(job, "CANCELLED")
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
-       
+        traceback.print_exc()
+        if not isinstance(e, HTTPException):
+            errors_total.inc(kind=type(e).__name__)
+        job["error"] = e.detail if isinstance(e, HTTPException) else str(e)
+        await _job_status(job, "ERROR", message=job["error"])
+    finally:
+        job["task"] = None
+        job["finished"] = True
+        job_stats["finished"] += 1
+        if job["id"] in jobs:
+            jobs[job["id"]] = jobs.pop(job["id"])  # finished order, for eviction
+            # Keep finished jobs around long enough for both peers to fetch the result
+            asyncio.get_running_loop().call_later(JOB_TTL_S, drop_job, job["id"])
+        evict_jobs()
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(
+    image_file: Optional[UploadFile] = File(None),
+    prompt: str = Form(...),
+    session: Optional[str] = Form(None),
+    base_result: Optional[str] = Form(None),
+    capture: Optional[str] = Form(None),
+):
+    """
+    Start an edit without holding the HTTP request open.
+    If `session` is given, JOB_STATUS events are pushed to the kiosk and tablet
+    in that room, and base_result can refer to an earlier result of the session.
+    """
+    image_bytes, staged = await resolve_input(image_file, session, base_result, capture)
+    if staged is None:
+        open_checked(image_bytes)  # reject bad uploads now, not via a later ERROR event
+    job = await start_job(image_bytes, prompt, session, staged)
+    return {"jobId": job["id"], "status": "QUEUED", "resultUrl": f"/api/jobs/{job['id']}/result"}
+
+async def start_job(image_bytes: bytes, prompt: str, session: Optional[str],
+                    capture: Optional[dict] = None) -> dict:
+    job_id = uuid.uuid4().hex
+    job = {
+        "id": job_id, "session": session, "status": "QUEUED",
+        "data": None, "media_type": None, "cache": None, "error": None, "task": None,
+        "result_id": None, "file_url": None, "finished": False,
+    }
+    jobs[job_id] = job
+    await _job_status(job, "QUEUED")
+    job["task"] = asyncio.create_task(_run_job(job, image_bytes, prompt, capture))
+    track_edit(session, job["task"])
+    print(f"[job] {job_id} queued (session={session})")
+    return job
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return {
+        "jobId": job_id, "status": job["status"], "error": job["error"],
+        "mediaType": job["media_type"], "resultId": job["result_id"], "fileUrl": job["file_url"],
+    }
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(
+    job_id: str,
+    format: Optional[str] = None,
+    quality: Optional[int] = None,
+    accept: Optional[str] = Header(None),
+):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    if job["status"] == "ERROR":
+        raise HTTPException(status_code=500, detail=f"An error occurred: {job['error']}")
+    if job["status"] != "DONE":
+        raise HTTPException(status_code=409, detail=f"Job not finished (status={job['status']})")
+    check_output_params(format, quality)
+    return await encode_response(job["data"], job["media_type"], accept, format, quality, {"X-Cache": job["cache"]})
+
+# ---------------- Draft previews ----------------
+# /api/edit?preview=1 runs the edit on a small copy of the input and returns it
+# with X-Draft-Id. If the user likes it, POST /api/drafts/{id}/confirm starts
+# the full-resolution edit as a job (JOB_STATUS pushes + /api/jobs/{id}/result).
+# If they move on (DELETE /api/drafts/{id}, a newer preview in the same
+# session, or the session ending) the draft is dropped and a full-res job
+# still running for it is cancelled, so discarded edits cost one cheap call.
+PREVIEW_MAX_EDGE = int(os.getenv("PREVIEW_MAX_EDGE", "512"))
+PREVIEW_QUALITY = int(os.getenv("PREVIEW_QUALITY", "70"))
+DRAFT_TTL_S = float(os.getenv("DRAFT_TTL_S", "600"))
+DRAFT_MAX_BYTES = int(os.getenv("DRAFT_MAX_BYTES", str(128 * 1024 * 1024)))
+
+# drafts[draftId] = {"id", "session", "prompt", "source", "job_id", "timer"}, oldest first;
+# "source" (the original upload) is released once the draft is confirmed, and a
+# confirmed draft only stays so discarding it can still cancel its job
+drafts: "OrderedDict[str, dict]" = OrderedDict()
+draft_stats = {"created": 0, "confirmed": 0, "discarded": 0, "expired": 0, "bytes": 0}
+drafts_total = metrics.counter("imgmod_drafts_total", "Draft previews by outcome", ["outcome"])
+
+def _draft_event(outcome: str):
+    draft_stats[outcome] += 1
+    drafts_total.inc(outcome=outcome)
+
+def _release_source(draft: dict):
+    if draft["source"] is not None:
+        draft_stats["bytes"] -= len(draft["source"])
+        draft["source"] = None
+
+def create_draft(source: bytes, prompt: str, session: Optional[str]) -> str:
+    if session is not None:
+        # A new preview means the user moved on from the previous one
+        for old in [d["id"] for d in drafts.values() if d["session"] == session]:
+            discard_draft(old)
+    draft_id = uuid.uuid4().hex[:12]
+    draft = {"id": draft_id, "session": session, "prompt": prompt, "source": source, "job_id": None}
+    draft["timer"] = asyncio.get_running_loop().call_later(DRAFT_TTL_S, discard_draft, draft_id, "expired", False)
+    drafts[draft_id] = draft
+    draft_stats["bytes"] += len(source)
+    _draft_event("created")
+    while draft_stats["bytes"] > DRAFT_MAX_BYTES and len(drafts) > 1:
+        discard_draft(next(iter(drafts)), outcome="expired", cancel=False)
+    return draft_id
+
+def discard_draft(draft_id: str, outcome: str = "discarded", cancel: bool = True) -> bool:
+    draft = drafts.pop(draft_id, None)
+    if draft is None:
+        return False
+    draft["timer"].cancel()
+    _release_source(draft)
+    job = jobs.get(draft["job_id"]) if draft["job_id"] else None
+    if cancel and job is not None and job["task"] is not None:
+        job["task"].cancel()
+        print(f"[draft] {draft_id} dropped, cancelled full-res job {job['id']}")
+    # A confirmed draft timing out is just cleanup; its outcome was "confirmed"
+    if not (outcome == "expired" and draft["job_id"]):
+        _draft_event(outcome)
+    return True
+
+def discard_session_drafts(session: str):
+    for draft_id in [d["id"] for d in drafts.values() if d["session"] == session]:
+        discard_draft(draft_id)
+
+@app.post("/api/drafts/{draft_id}/confirm", status_code=202)
+async def confirm_draft(draft_id: str):
+    draft = drafts.get(draft_id)
+    if draft is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired draft")
+    job = jobs.get(draft["job_id"]) if draft["job_id"] else None
+    if job is None:
+        if draft["source"] is None:
+            raise HTTPException(status_code=410, detail="Draft source is gone, edit again")
+        job = await start_job(draft["source"], draft["prompt"], draft["session"])
+        draft["job_id"] = job["id"]
+        _release_source(draft)
+        _draft_event("confirmed")
+    return {"draftId": draft_id, "jobId": job["id"], "status": job["status"],
+            "resultUrl": f"/api/jobs/{job['id']}/result"}
+
+@app.delete("/api/drafts/{draft_id}")
+async def delete_draft(draft_id: str):
+    if not discard_draft(draft_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired draft")
+    return {"draftId": draft_id, "status": "DISCARDED"}
+
+# ---------------- Capture pre-upload ----------------
+# The kiosk POSTs the photo to /api/captures as soon as it is taken, so reading,
+# validation and preprocessing (and, with CAPTURE_PREUPLOAD=1, the upload to
+# the provider's file store) happen while the tablet user is still typing.
+# The edit then sends capture=<captureId> and the prompt only. A session holds
+# one staged capture (a newer one replaces it); it goes with the session or
+# after CAPTURE_TTL_S without use.
+CAPTURE_TTL_S = float(os.getenv("CAPTURE_TTL_S", "900"))
+CAPTURE_MAX_BYTES = int(os.getenv("CAPTURE_MAX_BYTES", str(128 * 1024 * 1024)))
+CAPTURE_PREUPLOAD = os.getenv("CAPTURE_PREUPLOAD", "0") == "1"
+
+# captures[captureId] = {"id", "session", "source", "prepared", "digest", "bytes", "expires"}, least recently used first
+captures: "OrderedDict[str, dict]" = OrderedDict()
+capture_stats = {"staged": 0, "used": 0, "replaced": 0, "expired": 0, "preuploaded": 0, "preupload_failed": 0, "bytes": 0}
+
+def drop_capture(capture_id: str, outcome: str = "expired"):
+    staged = captures.pop(capture_id, None)
+    if staged is not None:
+        capture_stats["bytes"] -= staged["bytes"]
+        capture_stats[outcome] += 1
+
+def drop_session_captures(session: str, outcome: str = "expired"):
+    for capture_id in [c["id"] for c in captures.values() if c["session"] == session]:
+        drop_capture(capture_id, outcome)
+
+def expire_captures():
+    now = time.monotonic()
+    for capture_id in [c["id"] for c in captures.values() if c["expires"] < now]:
+        drop_capture(capture_id)
+
+def use_capture(capture_id: str, session: Optional[str]) -> dict:
+    expire_captures()
+    staged = captures.get(capture_id)
+    if staged is None or staged["session"] != session:
+        raise HTTPException(status_code=404, detail="Unknown or expired capture")
+    staged["expires"] = time.monotonic() + CAPTURE_TTL_S
+    captures.move_to_end(capture_id)
+    capture_stats["used"] += 1
+    return staged
+
+@app.post("/api/captures", status_code=201)
+async def stage_capture(
+    image_file: UploadFile = File(...),
+    session: Optional[str] = Form(None),
+):
+    """
+    Ingest a photo ahead of the edit: validated, preprocessed and kept for
+    CAPTURE_TTL_S. Returns {"captureId", "width", "height", "bytes", "preuploaded"};
+    pass captureId as `capture` to /api/edit, /api/edit/batch or /api/jobs
+    (with the same session).
+    """
+    image_bytes = await resolve_source(image_file, session, None)
+    prepared, digest = await prepare_source(image_bytes)
+    if CAPTURE_PREUPLOAD:
+        try:
+            prepared = prepared._replace(remote_uri=await provider.stage(prepared))
+            capture_stats["preuploaded"] += prepared.remote_uri is not None
+        except Exception as e:
+            # The edit just sends the bytes inline then
+            capture_stats["preupload_failed"] += 1
+            errors_total.inc(kind="capture_preupload")
+            print(f"[capture] pre-upload failed: {e}")
+
+    expire_captures()
+    if session is not None:
+        drop_session_captures(session, "replaced")
+    capture_id = uuid.uuid4().hex[:12]
+    size = len(image_bytes) + len(prepared.data)
+    captures[capture_id] = {
+        "id": capture_id, "session": session, "source": image_bytes, "prepared": prepared,
+        "digest": digest, "bytes": size, "expires": time.monotonic() + CAPTURE_TTL_S,
+    }
+    capture_stats["staged"] += 1
+    capture_stats["bytes"] += size
+    while capture_stats["bytes"] > CAPTURE_MAX_BYTES and len(captures) > 1:
+        drop_capture(next(iter(captures)))
+    print(f"[capture] staged {capture_id} (session={session}, preuploaded={prepared.remote_uri is not None})")
+    return {
+        "captureId": capture_id,
+        "width": prepared.size[0],
+        "height": prepared.size[1],
+        "bytes": len(prepared.data),
+        "preuploaded": prepared.remote_uri is not None,
+    }
 
 # ---------------- WebSockets: Pairing & Relay ----------------
 import asyncio
@@ -108,31 +1025,107 @@ import uuid
 from typing import Dict, Optional
 from fastapi import WebSocket, WebSocketDisconnect
 
+# Session registry + cross-worker relay. "memory" only works when kiosk and
+# tablet hit the same worker; "redis" lets them land on any worker/node.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+# Sessions nobody joins expire after SESSION_TTL_S; at most SESSION_MAX_LIVE
+# exist at once (idle ones older than SESSION_EVICT_MIN_AGE_S can be evicted
+# to make room, otherwise POST /session answers 503).
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "600"))
+SESSION_MAX_LIVE = int(os.getenv("SESSION_MAX_LIVE", "10000"))
+SESSION_EVICT_MIN_AGE_S = float(os.getenv("SESSION_EVICT_MIN_AGE_S", "60"))
+SESSION_SWEEP_INTERVAL_S = float(os.getenv("SESSION_SWEEP_INTERVAL_S", "30"))
+
+def build_session_store() -> SessionStore:
+    limits = dict(ttl=SESSION_TTL_S, max_live=SESSION_MAX_LIVE, evict_min_age=SESSION_EVICT_MIN_AGE_S)
+    if SESSION_BACKEND == "redis":
+        print("[session] backend: redis")
+        return RedisSessionStore(url=os.getenv("REDIS_URL", "redis://localhost:6379/0"), **limits)
+    print("[session] backend: memory")
+    return InMemorySessionStore(**limits)
+
+session_store = build_session_store()
+
 # rooms[sessionId] = {"kiosk": WebSocket|None, "tablet": WebSocket|None}
+# Only the sockets connected to *this* worker; the registry is session_store.
 rooms: Dict[str, Dict[str, Optional[WebSocket]]] = {}
+
+# Periodic cleanup of sessions that were created but never joined
+async def periodic_cleanup():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL_S)
+        try:
+            removed = await session_store.sweep()
+            if removed:
+                print(f"[cleanup] expired {removed} idle sessions")
+            # History goes with its session, whichever worker removed it
+            for sid in result_history.sessions():
+                if not await session_store.exists(sid):
+                    result_history.drop(sid)
+            result_store.sweep()
+            expire_captures()
+        except Exception as e:
+            print(f"[cleanup] sweep failed: {e}")
+
+async def warm_provider():
+    started = time.perf_counter()
+    try:
+        await provider.warm()
+        print(f"[provider] warm after {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        # Not fatal: the first edit imports/connects on its own
+        print(f"[provider] warm-up failed: {e}")
+
+async def startup():
+    await session_store.start(_deliver_local)
+    app.state.session_sweeper = asyncio.create_task(periodic_cleanup())
+    app.state.heartbeat = asyncio.create_task(heartbeat.run())
+    app.state.provider_warmup = asyncio.create_task(warm_provider()) if PROVIDER_WARMUP else None
+    await image_pool.warm()
+
+async def shutdown():
+    if app.state.provider_warmup is not None:
+        app.state.provider_warmup.cancel()
+    app.state.heartbeat.cancel()
+    app.state.session_sweeper.cancel()
+    await session_store.close()
+    image_pool.shutdown()
+
 @app.get("/ping")
 def check():
     return "checked"
 
 @app.post("/session")
-def create_session():
+async def create_session():
     """
     Create a short session code (e.g. 'A1B2C3') to pair kiosk & tablet.
     Tablet reads it from kiosk screen and connects.
     """
     sid = uuid.uuid4().hex[:6].upper()
-    rooms[sid] = {"kiosk": None, "tablet": None}
+    try:
+        await session_store.create(sid)
+    except SessionLimitError as e:
+        print(f"[session] rejected: {e}")
+        raise HTTPException(status_code=503, detail="Too many active sessions, try again shortly",
+                            headers={"Retry-After": str(max(1, int(SESSION_EVICT_MIN_AGE_S)))})
     print(f"[session] created {sid}")
     return {"sessionId": sid}
 
 @app.websocket("/ws")
-async def ws_endpoint(ws: WebSocket, session: str, role: str):
+async def ws_endpoint(ws: WebSocket, session: str, role: str, binary: bool = False, compress: Optional[str] = None):
     """
-    Connect with:  ws://.../ws?session=ABC123&role=kiosk|tablet
+    Connect with:  ws://.../ws?session=ABC123&role=kiosk|tablet[&binary=1[&compress=deflate]]
     - Exactly one kiosk and one tablet per session.
     - Any JSON message received is relayed to the opposite peer as-is.
+    - Binary frames (see frames.py) are relayed without JSON parsing. Peers that
+      connected with binary=1 get the bytes untouched; deflate-compressed frames
+      are inflated for peers that didn't negotiate compress=deflate, and JSON-only
+      peers get {type, dataUrl} instead.
+    - Outbound messages go through a bounded per-socket queue; a peer that
+      can't keep up loses its oldest messages (WS_SEND_OVERFLOW) rather than
+      delaying the sender.
     - Server also emits:
-        {type:"CONNECTED", role}
+        {type:"CONNECTED", role, binary, compression}
         {type:"PEER_STATUS", role:"kiosk|tablet", status:"online|offline"}
         {type:"ERROR", message:"..."} on basic validation failures
     """
@@ -141,7 +1134,7 @@ async def ws_endpoint(ws: WebSocket, session: str, role: str):
     print(f"[WS] incoming: session={session} role={role}")
 
     # Basic validation
-    if session not in rooms:
+    if not await session_store.exists(session):
         await _safe_send(ws, {"type": "ERROR", "message": "Invalid session"})
         await ws.close(code=4000)
         return
@@ -149,43 +1142,80 @@ async def ws_endpoint(ws: WebSocket, session: str, role: str):
         await _safe_send(ws, {"type": "ERROR", "message": "Invalid role"})
         await ws.close(code=4001)
         return
-    if rooms[session][role] is not None:
+    if not await session_store.claim(session, role):
         await _safe_send(ws, {"type": "ERROR", "message": f"{role} already connected"})
         await ws.close(code=4002)
         return
 
     # Register
-    rooms[session][role] = ws
-    await _safe_send(ws, {"type": "CONNECTED", "role": role})
-    await _broadcast(session, {"type": "PEER_STATUS", "role": role, "status": "online"})
+    ws.state.session = session
+    ws.state.role = role
+    ws.state.binary = binary
+    ws.state.deflate = binary and compress == "deflate"
+    ws.state.outbox = _open_outbox(ws)
+    rooms.setdefault(session, {"kiosk": None, "tablet": None})[role] = ws
+    await session_store.subscribe(session, role)
+    _queue_json(ws, {
+        "type": "CONNECTED",
+        "role": role,
+        "binary": ws.state.binary,
+        "compression": "deflate" if ws.state.deflate else None,
+    })
+    await _broadcast(session, {"type": "PEER_STATUS", "role": role, "status": "online"}, status=True)
 
-    # Optional heartbeat to keep some proxies from idling out
-    heartbeat_task = asyncio.create_task(_heartbeat(ws))
+    # Shared heartbeat keeps proxies from idling out and spots dead peers
+    heartbeat.register(ws)
 
     try:
         while True:
             # Any JSON payload is simply relayed to the other peer
-            msg = await ws.receive_json()
+            event = await ws.receive()
+            if event["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(event.get("code", 1000))
+            text, data = event.get("text"), event.get("bytes")
+            heartbeat.seen(ws)
+            if data is not None:
+                # Only the header is checked; the payload is never parsed
+                try:
+                    unpack_header(data)
+                except FrameError as e:
+                    errors_total.inc(kind="bad_frame")
+                    _queue_json(ws, {"type": "ERROR", "message": f"Bad frame: {e}"})
+                    continue
+                message = data
+                kind = "binary"
+            else:
+                msg = json.loads(text)  # same validation receive_json() did
+                if isinstance(msg, dict) and msg.get("type") == "PONG":
+                    heartbeat.pong(ws)
+                    continue
+                if role == "tablet" and isinstance(msg, dict) and msg.get("type") in SUPERSEDING_MESSAGES:
+                    # The kiosk is about to start something new; the old edit is moot
+                    cancel_session_edits(session, "superseded")
+                # Forward the original text; no need to re-serialize
+                message = text
+                kind = "text"
             target = "kiosk" if role == "tablet" else "tablet"
 
-            # small guard: ensure target exists before relaying
-            peer = rooms.get(session, {}).get(target)
-            if peer is None:
+            # publish() is False when nobody holds the target role
+            if await session_store.publish(session, target, message):
+                relay_messages_total.inc(kind=kind)
+                relay_bytes_total.inc(len(message), kind=kind)
+            else:
                 # still ACK locally so caller can react (e.g., show “kiosk offline”)
-                await _safe_send(ws, {
+                _queue_json(ws, {
                     "type": "ERROR",
                     "message": f"{target} not connected"
                 })
-                continue
-
-            await _safe_send(peer, msg)
 
     except WebSocketDisconnect:
         print(f"[WS] disconnect: session={session} role={role}")
     except Exception as e:
+        errors_total.inc(kind=f"ws_{type(e).__name__}")
         print(f"[WS] error ({role}): {e}")
     finally:
-        heartbeat_task.cancel()
+        heartbeat.unregister(ws)
+        ws.state.outbox.close()
         await _cleanup_ws(session, role, ws)
 
 async def _safe_send(ws: WebSocket, data: dict):
@@ -194,43 +1224,162 @@ async def _safe_send(ws: WebSocket, data: dict):
     except Exception:
         pass
 
-async def _broadcast(session: str, payload: dict):
-    for peer in rooms.get(session, {}).values():
-        if peer is not None:
-            try:
-                await peer.send_json(payload)
-            except Exception:
-                # ignore send errors; cleanup happens elsewhere
-                pass
+async def _safe_send_text(ws: WebSocket, text: str):
+    try:
+        await ws.send_text(text)
+    except Exception:
+        pass
 
-async def _cleanup_ws(session: str, role: str, ws: WebSocket):
-    # Remove this role if it’s the same socket
+async def _safe_send_bytes(ws: WebSocket, data: bytes):
     try:
-        if rooms.get(session, {}).get(role) is ws:
-            rooms[session][role] = None
+        await ws.send_bytes(data)
     except Exception:
         pass
 
+async def _deliver_local(session: str, role: str, message, status: bool = False):
+    """session_store callback: hand a relayed message to the socket on this worker."""
+    ws = rooms.get(session, {}).get(role)
+    if ws is None:
+        return
+    if isinstance(message, bytes):
+        _deliver_frame(ws, message)
+    else:
+        ws.state.outbox.put(message, _status_key(json.loads(message)) if status else None)
+
+def _deliver_frame(peer: WebSocket, data: bytes):
+    """Forward a binary frame, adapting it only if the peer can't take it as-is."""
+    try:
+        header = unpack_header(data)
+        if not getattr(peer.state, "binary", False):
+            _queue_json(peer, frame_to_json(data, header, WS_FRAME_MAX_INFLATED))
+        elif header.flags & FLAG_DEFLATE and not peer.state.deflate:
+            payload = frame_payload(data, header, WS_FRAME_MAX_INFLATED)
+            peer.state.outbox.put(pack_frame(header.type, payload, header.mime))
+        else:
+            peer.state.outbox.put(data)
+    except FrameError as e:
+        errors_total.inc(kind="bad_frame")
+        print(f"[WS] dropped bad frame: {e}")
+
+async def _broadcast(session: str, payload: dict, status: bool = False):
+    text = json.dumps(payload)
+    # return_exceptions: ignore send errors; cleanup happens elsewhere
+    await asyncio.gather(*(session_store.publish(session, role, text, status) for role in ROLES),
+                         return_exceptions=True)
+
+async def _cleanup_ws(session: str, role: str, ws: WebSocket):
+    # Remove this role if it’s the same socket
+    entry = rooms.get(session)
+    if entry is None or entry.get(role) is not ws:
+        return
+    entry[role] = None
+    if entry["kiosk"] is None and entry["tablet"] is None:
+        rooms.pop(session, None)
+    if role == "kiosk":
+        # Nobody left to display what's still being edited
+        cancel_session_edits(session, "kiosk_left")
+
+    try:
+        await session_store.unsubscribe(session, role)
+        emptied = await session_store.release(session, role)
+    except Exception as e:
+        print(f"[session] release failed {session}/{role}: {e}")
+        emptied = False
+
+    # If both sides are gone, the store has deleted the session
+    if emptied:
+        result_history.drop(session)
+        discard_session_drafts(session)
+        drop_session_captures(session)
+        print(f"[session] removed empty {session}")
+
     # Tell the other side we went offline
-    await _broadcast(session, {"type": "PEER_STATUS", "role": role, "status": "offline"})
+    await _broadcast(session, {"type": "PEER_STATUS", "role": role, "status": "offline"}, status=True)
+
+# ---------------- Outbound queues ----------------
+# Every registered socket gets a bounded SendQueue (see sendqueue.py) drained
+# by its own writer task; nothing on the relay path awaits a peer's socket.
+WS_SEND_QUEUE_MAX = int(os.getenv("WS_SEND_QUEUE_MAX", "64"))
+WS_SEND_QUEUE_MAX_BYTES = int(os.getenv("WS_SEND_QUEUE_MAX_BYTES", str(16 * 1024 * 1024)))
+WS_SEND_OVERFLOW = os.getenv("WS_SEND_OVERFLOW", "coalesce").lower()  # coalesce | drop_oldest | disconnect
+# Cap on a deflated frame's payload once inflated for a peer that can't take it compressed
+WS_FRAME_MAX_INFLATED = int(os.getenv("WS_FRAME_MAX_INFLATED", str(MAX_INFLATED_BYTES)))
+
+# Server-originated status messages (PEER_STATUS, JOB_STATUS, PING) are queued
+# with status=True; a newer one with the same key makes a queued one moot.
+# Relayed payloads never carry the flag, whatever their text looks like.
+def _status_key(msg: dict) -> tuple:
+    return (msg["type"], msg.get("role"), msg.get("jobId"))
+
+def _open_outbox(ws: WebSocket) -> SendQueue:
+    async def send(message):
+        if isinstance(message, bytes):
+            await _safe_send_bytes(ws, message)
+        else:
+            await _safe_send_text(ws, message)
+
+    async def on_overflow():
+        session, role = ws.state.session, ws.state.role
+        print(f"[WS] send queue overflow, disconnecting: session={session} role={role}")
+        await _cleanup_ws(session, role, ws)
+        try:
+            await asyncio.wait_for(ws.close(code=4429), timeout=2.0)
+        except Exception:
+            pass
 
-    # If both sides are gone, delete the room
+    outbox = SendQueue(
+        send, on_overflow,
+        max_messages=WS_SEND_QUEUE_MAX,
+        max_bytes=WS_SEND_QUEUE_MAX_BYTES,
+        policy=WS_SEND_OVERFLOW,
+        on_drop=lambda reason: ws_send_dropped_total.inc(reason=reason),
+    )
+    outbox.start()
+    return outbox
+
+def _queue_json(ws: WebSocket, data: dict, status: bool = False):
+    ws.state.outbox.put(json.dumps(data), _status_key(data) if status else None)
+
+def _outboxes() -> List[Tuple[str, str, SendQueue]]:
+    return [
+        (sid, role, ws.state.outbox)
+        for sid, entry in rooms.items()
+        for role, ws in entry.items()
+        if ws is not None
+    ]
+
+def _send_queue_stats(top: int = 10) -> dict:
+    outboxes = _outboxes()
+    deepest = sorted(outboxes, key=lambda o: len(o[2]), reverse=True)[:top]
+    return {
+        "policy": WS_SEND_OVERFLOW,
+        "max_messages": WS_SEND_QUEUE_MAX,
+        "max_bytes": WS_SEND_QUEUE_MAX_BYTES,
+        "sockets": len(outboxes),
+        "queued": sum(len(q) for _, _, q in outboxes),
+        "deepest": [{"session": sid, "role": role, **q.snapshot()} for sid, role, q in deepest],
+    }
+
+# ---------------- Heartbeat ----------------
+async def _send_ping(ws: WebSocket):
+    _queue_json(ws, {"type": "PING", "ts": asyncio.get_event_loop().time()}, status=True)
+
+async def _evict_dead(ws: WebSocket):
+    """Peer stopped answering PINGs: free its role slot now, then close."""
+    session, role = ws.state.session, ws.state.role
+    print(f"[WS] evicting dead peer: session={session} role={role}")
+    await _cleanup_ws(session, role, ws)
     try:
-        entry = rooms.get(session)
-        if entry and entry["kiosk"] is None and entry["tablet"] is None:
-            rooms.pop(session, None)
-            print(f"[session] removed empty {session}")
+        await asyncio.wait_for(ws.close(code=4408), timeout=2.0)
     except Exception:
         pass
 
-async def _heartbeat(ws: WebSocket, interval: float = 25.0):
-    """
-    Best-effort keepalive; some hosts/proxies close idle WS after ~30s.
-    This sends a trivial JSON ping periodically.
-    """
-    try:
-        while True:
-            await asyncio.sleep(interval)
-            await _safe_send(ws, {"type": "PING", "ts": asyncio.get_event_loop().time()})
-    except Exception:
-        pass
\ No newline at end of file
+# Best-effort keepalive; some hosts/proxies close idle WS after ~30s.
+# Clients that answer {type:"PING"} with {type:"PONG"} also get dead-peer detection.
+heartbeat = HeartbeatScheduler(
+    send_ping=_send_ping,
+    on_dead=_evict_dead,
+    interval=float(os.getenv("HEARTBEAT_INTERVAL_S", "25")),
+    slots=int(os.getenv("HEARTBEAT_SLOTS", "50")),
+    max_missed=int(os.getenv("HEARTBEAT_MAX_MISSED", "2")),
+)
@@ -0,0 +1,211 @@
+"""
+Minimal in-process metrics with Prometheus text exposition (format 0.0.4).
+
+Counters, gauges and histograms with labels, kept in plain dicts per worker.
+No client library needed; GET /metrics renders everything in the registry.
+
+StageTimer times named stages of a request: each stage is observed in a
+histogram and also collected per request (via a ContextVar) so the
+ServerTiming middleware can return it as a Server-Timing header.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labels, k)} {_num(v)}" for k, v in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        row = self._values.get(key)
+        if row is None:
+            row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                row[i] += 1
+        row[-2] += value
+        row[-1] += 1
+
+    def _samples(self) -> List[str]:
+        out = []
+        for key, row in self._values.items():
+            for i, bound in enumerate(self.buckets):
+                le = 'le="%s"' % _num(bound)
+                out.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {row[i]}")
+            out.append(f"{self.name}_sum{_labels(self.labels, key)} {_num(row[-2])}")
+            out.append(f"{self.name}_count{_labels(self.labels, key)} {row[-1]}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("server_timing", default=None)
+
+
+class StageTimer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def begin(self) -> List[Tuple[str, float]]:
+        """Start collecting stages for the current request (call in the middleware)."""
+        timings: List[Tuple[str, float]] = []
+        _timings.set(timings)
+        return timings
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float):
+        self.histogram.observe(seconds, stage=name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, seconds))
+
+    @staticmethod
+    def header(timings: Sequence[Tuple[str, float]]) -> str:
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings)
+
+
+class ServerTiming:
+    """
+    ASGI middleware: per-request stages plus "total" (time until the response
+    headers go out) as a Server-Timing header, and request time/status metrics
+    per route. Only http.response.start is touched; the body passes through
+    as-is, so file responses keep their zero-copy path.
+    """
+
+    def __init__(self, app, timer: StageTimer, request_seconds: Histogram, responses: Counter):
+        self.app = app
+        self.timer = timer
+        self.request_seconds = request_seconds
+        self.responses = responses
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        timings = self.timer.begin()
+        started = time.perf_counter()
+        status = None
+
+        def observe(status_code: int) -> float:
+            elapsed = time.perf_counter() - started
+            # The router leaves the matched route in the scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.request_seconds.observe(elapsed, route=route)
+            self.responses.inc(route=route, status=str(status_code))
+            return elapsed
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = observe(status)
+                header = self.timer.header(timings + [("total", elapsed)])
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"server-timing", header.encode("latin-1")),
+                    (b"timing-allow-origin", b"*"),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        except Exception:
+            if status is None:
+                observe(500)
+            raise
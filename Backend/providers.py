@@ -0,0 +1,165 @@
+"""
+Image-edit providers behind /api/edit.
+
+A provider takes the final prompt plus the preprocessed upload and returns
+(result bytes, media type). `model` is part of the cache key, so results
+from different providers/models never mix.
+
+  - GeminiProvider: google-genai async client (the production path)
+  - StubProvider:   local, deterministic PIL background tint with configurable
+                    latency and optional simulated 429s, for load-testing the
+                    HTTP/WebSocket pipeline offline without spending quota
+
+Select with EDIT_PROVIDER=gemini|stub.
+"""
+import asyncio
+import hashlib
+import random
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from imaging import PreparedImage, sniff_mime
+
+
+class ProviderError(Exception):
+    pass
+
+
+class EditProvider:
+    name = "base"
+    model = ""
+
+    async def edit(self, prompt: str, image: PreparedImage) -> Tuple[bytes, str]:
+        raise NotImplementedError
+
+    async def stage(self, image: PreparedImage) -> Optional[str]:
+        """Pre-upload an image to the provider's file store; returns its URI, or None if not supported."""
+        return None
+
+    async def warm(self):
+        """Get ready for the first edit (SDK imports, connections). Called in the background at startup."""
+        pass
+
+    def is_retryable(self, e: BaseException) -> bool:
+        """Transient upstream errors (quota, overload) worth retrying."""
+        return getattr(e, "code", None) in (429, 503)
+
+
+class GeminiProvider(EditProvider):
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str], model: str = "gemini-2.5-flash-image-preview"):
+        # google.genai is imported and the client built on first use, not at
+        # import time: together they are most of the worker's startup cost
+        self.api_key = api_key
+        self.model = model
+        self._client = None
+        self._types = None
+        self._loading: Optional[asyncio.Future] = None
+
+    def _load(self):
+        from google import genai
+        from google.genai import types as genai_types
+
+        self._types = genai_types
+        if self._client is None:
+            self._client = genai.Client(api_key=self.api_key)
+
+    async def ready(self):
+        """Import the SDK and build the client once, in a thread so the event loop keeps serving."""
+        if self._client is None or self._types is None:
+            if self._loading is None:
+                self._loading = asyncio.ensure_future(asyncio.to_thread(self._load))
+            try:
+                await asyncio.shield(self._loading)
+            except Exception:
+                self._loading = None
+                raise
+        return self._client
+
+    async def warm(self):
+        client = await self.ready()
+        # A metadata call opens the pooled HTTPS connection (and checks the key
+        # and model) before the first edit needs it
+        await client.aio.models.get(model=self.model)
+
+    async def edit(self, prompt: str, image: PreparedImage) -> Tuple[bytes, str]:
+        client = await self.ready()
+        # Send the already-encoded upload (or point at the pre-uploaded copy);
+        # handing the SDK a PIL image makes it re-encode the frame as PNG.
+        if image.remote_uri:
+            part = self._types.Part.from_uri(file_uri=image.remote_uri, mime_type=image.mime_type)
+        else:
+            part = self._types.Part.from_bytes(data=image.data, mime_type=image.mime_type)
+        contents = [prompt, part]
+        response = await client.aio.models.generate_content(model=self.model, contents=contents)
+
+        for part in response.candidates[0].content.parts:
+            if part.inline_data is not None:
+                # Passthrough: no decode/re-encode, just label the bytes correctly
+                result = part.inline_data.data
+                return result, sniff_mime(result) or part.inline_data.mime_type or "image/png"
+
+        raise ProviderError("No image found in Gemini API response.")
+
+    async def stage(self, image: PreparedImage) -> Optional[str]:
+        client = await self.ready()
+        # Files API uploads expire on their own after 48h
+        uploaded = await client.aio.files.upload(
+            file=BytesIO(image.data), config=self._types.UploadFileConfig(mime_type=image.mime_type)
+        )
+        return uploaded.uri
+
+
+class StubBusy(Exception):
+    code = 429
+
+
+class StubProvider(EditProvider):
+    """
+    Tints the image towards a colour derived from the prompt, fading in from
+    the top like a new backdrop, and returns a PNG as Gemini does. Same input,
+    same output; only the latency is random.
+    """
+    name = "stub"
+
+    def __init__(self, latency_s: float = 2.0, jitter_s: float = 0.5, error_rate: float = 0.0):
+        self.model = "stub-v1"
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.error_rate = error_rate
+
+    async def edit(self, prompt: str, image: PreparedImage) -> Tuple[bytes, str]:
+        await asyncio.sleep(max(0.0, self.latency_s + random.uniform(-self.jitter_s, self.jitter_s)))
+        if self.error_rate and random.random() < self.error_rate:
+            raise StubBusy("stub provider: simulated quota exhaustion")
+        data = await asyncio.to_thread(self._render, prompt, image.data)
+        return data, "image/png"
+
+    @staticmethod
+    def _render(prompt: str, data: bytes) -> bytes:
+        base = Image.open(BytesIO(data)).convert("RGB")
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        backdrop = Image.new("RGB", base.size, tuple(digest[:3]))
+        # Strong at the top, fading out towards the subject at the bottom
+        mask = Image.linear_gradient("L").rotate(180).resize(base.size).point(lambda v: v * 3 // 5)
+        out = Image.composite(backdrop, base, mask)
+
+        buf = BytesIO()
+        out.save(buf, format="PNG", compress_level=1)
+        return buf.getvalue()
+
+
+def build_provider(name: str, **options) -> EditProvider:
+    name = name.lower()
+    if name == "gemini":
+        return GeminiProvider(options.get("api_key"), options.get("model") or "gemini-2.5-flash-image-preview")
+    if name == "stub":
+        return StubProvider(
+            latency_s=options.get("latency_s", 2.0),
+            jitter_s=options.get("jitter_s", 0.5),
+            error_rate=options.get("error_rate", 0.0),
+        )
+    raise ValueError(f"Unknown EDIT_PROVIDER: {name}")
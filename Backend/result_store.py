@@ -0,0 +1,179 @@
+"""
+Content-addressed store for edited images, served straight from disk.
+
+Each result is one file named "<sha256 of the bytes>.<ext>" under `root`,
+holding exactly the bytes the client gets, so GET /api/results/{id} can hand
+the path to FileResponse (sendfile where the server supports it, ranges,
+conditional requests) and the id doubles as a strong ETag. Storing the same
+bytes again only refreshes the entry; concurrent puts of the same bytes (e.g.
+coalesced edits) share one write.
+
+Eviction: entries older than max_age_s, and the least recently stored ones
+once the total exceeds max_bytes. The index is rebuilt from the directory
+on start, so results survive restarts.
+"""
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+EXTENSIONS = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/avif": "avif",
+    "image/gif": "gif",
+}
+MEDIA_TYPES = {ext: mime for mime, ext in EXTENSIONS.items()}
+
+
+class StoredResult(NamedTuple):
+    id: str
+    path: str
+    media_type: str
+    stat: os.stat_result
+
+
+class ResultStore:
+    def __init__(self, root: str, max_bytes: int, max_age_s: float):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+
+        # id -> (file name, size, stored at), least recently stored first
+        self._index: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        # id -> task writing it, so identical concurrent puts write (and count) once
+        self._writing: Dict[str, asyncio.Task] = {}
+        self.stats = {"stored": 0, "refreshed": 0, "evicted_size": 0, "evicted_age": 0}
+
+        os.makedirs(self.root, exist_ok=True)
+        self._load_index()
+
+    # ---------- public ----------
+    async def put(self, data: bytes, media_type: str) -> str:
+        rid = hashlib.sha256(data).hexdigest()
+        name = f"{rid}.{EXTENSIONS.get(media_type, 'bin')}"
+        now = time.time()
+        if rid in self._index:
+            self._index.move_to_end(rid)
+            self._index[rid] = (self._index[rid][0], self._index[rid][1], now)
+            self.stats["refreshed"] += 1
+            # Keep the file's mtime in step so a restart sees the same age
+            await asyncio.to_thread(self._touch, self._index[rid][0], now)
+            return rid
+
+        writing = self._writing.get(rid)
+        if writing is None:
+            writing = asyncio.ensure_future(self._store(rid, name, data, now))
+            self._writing[rid] = writing
+            writing.add_done_callback(lambda t: self._written(rid, t))
+        else:
+            self.stats["refreshed"] += 1
+        # A caller that goes away doesn't abort the write others are waiting on
+        await asyncio.shield(writing)
+        return rid
+
+    def get(self, rid: str) -> Optional[StoredResult]:
+        entry = self._index.get(rid)
+        if entry is None:
+            return None
+        name, _, stored_at = entry
+        if time.time() - stored_at > self.max_age_s:
+            self._drop(rid)
+            self.stats["evicted_age"] += 1
+            return None
+        path = os.path.join(self.root, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._drop(rid)
+            return None
+        ext = name.rsplit(".", 1)[-1]
+        return StoredResult(rid, path, MEDIA_TYPES.get(ext, "application/octet-stream"), st)
+
+    def sweep(self) -> int:
+        """Drop entries past max_age_s; returns how many."""
+        cutoff = time.time() - self.max_age_s
+        expired = [rid for rid, (_, _, stored_at) in self._index.items() if stored_at < cutoff]
+        for rid in expired:
+            self._drop(rid)
+        self.stats["evicted_age"] += len(expired)
+        return len(expired)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "entries": len(self._index),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "max_age_s": self.max_age_s,
+        }
+
+    # ---------- internals ----------
+    def _load_index(self):
+        entries = []
+        for name in os.listdir(self.root):
+            rid, _, ext = name.partition(".")
+            path = os.path.join(self.root, name)
+            if len(rid) != 64 or ext not in MEDIA_TYPES or not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, rid, name, st.st_size))
+        for mtime, rid, name, size in sorted(entries):
+            self._index[rid] = (name, size, mtime)
+            self._bytes += size
+        self.sweep()
+        self._evict()
+
+    async def _store(self, rid: str, name: str, data: bytes, now: float):
+        size = await asyncio.to_thread(self._write, name, data)
+        self._index[rid] = (name, size, now)
+        self._bytes += size
+        self.stats["stored"] += 1
+        self._evict()
+
+    def _written(self, rid: str, task: asyncio.Task):
+        self._writing.pop(rid, None)
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller went away; callers still get it
+
+    def _write(self, name: str, data: bytes) -> int:
+        path = os.path.join(self.root, name)
+        # Own temp name per write: other workers may be writing the same result
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        return len(data)
+
+    def _touch(self, name: str, now: float):
+        try:
+            os.utime(os.path.join(self.root, name), (now, now))
+        except OSError:
+            pass
+
+    def _drop(self, rid: str):
+        entry = self._index.pop(rid, None)
+        if entry is None:
+            return
+        self._bytes -= entry[1]
+        try:
+            os.remove(os.path.join(self.root, entry[0]))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._index and self._bytes > self.max_bytes:
+            self._drop(next(iter(self._index)))
+            self.stats["evicted_size"] += 1
@@ -0,0 +1,199 @@
+"""
+Scheduler in front of the model API.
+
+Calls wait in a priority queue (lower value first, FIFO within a priority)
+and are dispatched once both a concurrency slot and a rate-limit token are
+free. The token bucket refills at `rate` calls/s up to `burst`, matched to
+the upstream quota, so a burst from many kiosks queues here instead of
+coming back as 429s.
+
+Every call has a deadline: it is dropped from the queue if the deadline
+passes before dispatch, and the running call is cancelled when it runs out.
+A cancelled caller leaves the queue, or frees its slot, immediately.
+Retryable failures (429/503 upstream) are retried with full-jitter
+exponential backoff while the backoff still fits in the remaining deadline;
+a retry queues again at its original priority.
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    pass
+
+
+class UpstreamBusy(Exception):
+    """Retryable upstream error that outlived its retries or its deadline."""
+
+    def __init__(self, cause: BaseException, retry_after: float):
+        super().__init__(str(cause))
+        self.cause = cause
+        self.retry_after = retry_after
+
+
+class ModelScheduler:
+    def __init__(
+        self,
+        max_inflight: int = 4,
+        rate: float = 0.0,
+        burst: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 20.0,
+        is_retryable: Callable[[BaseException], bool] = lambda e: False,
+    ):
+        self.max_inflight = max(1, max_inflight)
+        self.rate = rate                    # tokens per second; 0 = no rate limit
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.is_retryable = is_retryable
+
+        # heap of (priority, seq, future, queued_at); abandoned futures are skipped lazily
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._waiting: Dict[int, int] = {}
+        self._inflight = 0
+        self._tokens = float(self.burst)
+        self._refilled = time.monotonic()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+
+        self.stats = {
+            "calls": 0,
+            "retries": 0,
+            "gave_up": 0,
+            "deadline_expired": 0,
+            "cancelled_queued": 0,
+            "cancelled_running": 0,
+            "queue_wait_total_s": 0.0,
+            "queue_wait_max_s": 0.0,
+            "last_queue_wait_s": 0.0,
+        }
+
+    # ---------- public ----------
+    async def call(self, fn: Callable[[], Awaitable[Any]], priority: int = PRIORITY_INTERACTIVE,
+                   timeout: float = 60.0) -> Any:
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            await self._acquire(priority, deadline)
+            try:
+                return await asyncio.wait_for(fn(), max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError as e:
+                if time.monotonic() >= deadline:
+                    self.stats["deadline_expired"] += 1
+                    raise DeadlineExceeded("model call ran past its deadline")
+                # the provider's own timeout, raised before ours: an ordinary upstream error
+                if not self.is_retryable(e):
+                    raise
+                error = e
+            except asyncio.CancelledError:
+                self.stats["cancelled_running"] += 1
+                raise
+            except Exception as e:
+                if not self.is_retryable(e):
+                    raise
+                error = e
+            finally:
+                self._release()
+
+            delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+            if attempt >= self.max_retries or time.monotonic() + delay >= deadline:
+                self.stats["gave_up"] += 1
+                raise UpstreamBusy(error, retry_after=max(delay, self.backoff_base))
+            attempt += 1
+            self.stats["retries"] += 1
+            print(f"[scheduler] upstream busy ({error}); retry {attempt} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> dict:
+        calls = self.stats["calls"]
+        self._refill()
+        return {
+            **self.stats,
+            "queued": sum(self._waiting.values()),
+            "queued_by_priority": dict(sorted(self._waiting.items())),
+            "inflight": self._inflight,
+            "max_inflight": self.max_inflight,
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "tokens": round(self._tokens, 3),
+            "queue_wait_avg_s": (self.stats["queue_wait_total_s"] / calls) if calls else 0.0,
+        }
+
+    # ---------- internals ----------
+    async def _acquire(self, priority: int, deadline: float):
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._seq), fut, time.monotonic()))
+        self._waiting[priority] = self._waiting.get(priority, 0) + 1
+        self._pump()
+        try:
+            await asyncio.wait_for(fut, max(0.0, deadline - time.monotonic()))
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # Granted in the same tick we gave up: hand the slot back
+                self._release()
+            else:
+                fut.cancel()
+                self._forget(priority)
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["deadline_expired"] += 1
+                raise DeadlineExceeded("deadline passed while queued for the model")
+            if isinstance(e, asyncio.CancelledError):
+                self.stats["cancelled_queued"] += 1
+            raise
+
+    def _forget(self, priority: int):
+        self._waiting[priority] -= 1
+        if not self._waiting[priority]:
+            del self._waiting[priority]
+
+    def _release(self):
+        self._inflight -= 1
+        self._pump()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._refilled) * self.rate)
+        else:
+            self._tokens = float(self.burst)
+        self._refilled = now
+
+    def _pump(self):
+        self._refill()
+        while self._queue and self._inflight < self.max_inflight:
+            priority, _, fut, queued_at = self._queue[0]
+            if fut.done():
+                heapq.heappop(self._queue)
+                continue
+            if self._tokens < 1:
+                self._schedule_wakeup((1 - self._tokens) / self.rate)
+                return
+            heapq.heappop(self._queue)
+            self._forget(priority)
+            self._tokens -= 1
+            self._inflight += 1
+
+            wait = time.monotonic() - queued_at
+            self.stats["calls"] += 1
+            self.stats["queue_wait_total_s"] += wait
+            self.stats["queue_wait_max_s"] = max(self.stats["queue_wait_max_s"], wait)
+            self.stats["last_queue_wait_s"] = wait
+            fut.set_result(None)
+
+    def _schedule_wakeup(self, delay: float):
+        if self._wakeup is None:
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._on_wakeup)
+
+    def _on_wakeup(self):
+        self._wakeup = None
+        self._pump()
@@ -0,0 +1,112 @@
+"""
+Bounded outbound queue for one WebSocket, drained by its own writer task.
+
+Relaying to a peer only appends to that peer's queue, so a tablet on bad
+Wi-Fi slows down nobody but itself: the sender's receive loop and the rest
+of the room never wait on its socket. The policy decides what happens to the
+backlog:
+
+  coalesce     (default) on every put, a message with a key replaces a queued
+               one with the same key (e.g. PEER_STATUS for the same role)
+               instead of adding to the backlog; when the queue is full
+               (max_messages or max_bytes) the oldest message is dropped
+  drop_oldest  keys are ignored; when full, drop the oldest queued message
+  disconnect   when full, give up on the peer: on_overflow() is called, the
+               queue closes
+
+The newest message is always kept, even if it alone exceeds max_bytes.
+"""
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Deque, Hashable, List, Optional, Union
+
+Message = Union[str, bytes]
+
+POLICIES = ("coalesce", "drop_oldest", "disconnect")
+
+
+class SendQueue:
+    def __init__(
+        self,
+        send: Callable[[Message], Awaitable[None]],
+        on_overflow: Callable[[], Awaitable[None]],
+        max_messages: int = 64,
+        max_bytes: int = 16 * 1024 * 1024,
+        policy: str = "coalesce",
+        on_drop: Callable[[str], None] = lambda reason: None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy} (expected one of {', '.join(POLICIES)})")
+        self.send = send
+        self.on_overflow = on_overflow
+        self.max_messages = max(1, max_messages)
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.on_drop = on_drop
+
+        # [message, coalesce key or None]
+        self._items: Deque[List] = deque()
+        self._bytes = 0
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+        self.stats = {"sent": 0, "dropped": 0, "coalesced": 0, "max_depth": 0}
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def start(self):
+        self._task = asyncio.create_task(self._drain())
+
+    def put(self, message: Message, key: Optional[Hashable] = None) -> bool:
+        """Queue a message without waiting. False if it was refused (queue closed)."""
+        if self.closed:
+            return False
+        if key is not None and self.policy == "coalesce":
+            for item in self._items:
+                if item[1] == key:
+                    # Latest state wins, and goes behind whatever was queued meanwhile
+                    self._items.remove(item)
+                    self._bytes -= len(item[0])
+                    self.stats["coalesced"] += 1
+                    self.on_drop("coalesced")
+                    break
+
+        self._items.append([message, key])
+        self._bytes += len(message)
+        while len(self._items) > 1 and (len(self._items) > self.max_messages or self._bytes > self.max_bytes):
+            if self.policy == "disconnect":
+                self.stats["dropped"] += len(self._items)
+                self.on_drop("disconnect")
+                self.close()
+                asyncio.get_running_loop().create_task(self.on_overflow())
+                return False
+            old, _ = self._items.popleft()
+            self._bytes -= len(old)
+            self.stats["dropped"] += 1
+            self.on_drop("overflow")
+
+        self.stats["max_depth"] = max(self.stats["max_depth"], len(self._items))
+        self._ready.set()
+        return True
+
+    def close(self):
+        """Stop the writer (even mid-send) and discard anything still queued."""
+        self.closed = True
+        self._items.clear()
+        self._bytes = 0
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "depth": len(self._items), "bytes": self._bytes}
+
+    async def _drain(self):
+        while True:
+            while not self._items:
+                self._ready.clear()
+                await self._ready.wait()
+            message, _ = self._items.popleft()
+            self._bytes -= len(message)
+            await self.send(message)
+            self.stats["sent"] += 1
@@ -0,0 +1,364 @@
+"""
+Session registry + peer relay for kiosk/tablet pairing.
+
+The WebSocket objects always live on the worker that accepted them; what is
+pluggable is (a) which sessions exist and which roles are taken, and (b) how a
+message reaches a peer that may be connected to another worker.
+
+  - InMemorySessionStore: single process, messages are handed straight to the
+    local socket (the original behaviour).
+  - RedisSessionStore: registry in Redis hashes, relay over pub/sub
+    (one channel per session+role), so kiosk and tablet can land on different
+    workers or hosts. Needs the `redis` package; tests and benchmarks can point
+    it at a local stand-in such as fakeredis' TcpFakeServer.
+
+Messages are either str (JSON text) or bytes (binary frames, see frames.py).
+publish(status=True) marks server status text (a newer one supersedes a queued
+one); the flag reaches deliver() on whichever worker holds the peer.
+
+Lifecycle: a session nobody has joined expires `ttl` seconds after creation.
+Once a peer claims a role it is pinned until both roles are released (which
+deletes it). sweep() removes expired sessions at O(expired) cost per pass, and
+create() enforces `max_live`: when full it sweeps, then evicts the oldest
+never-joined session if it is at least `evict_min_age` old, and otherwise
+raises SessionLimitError so the caller can answer 503.
+"""
+import asyncio
+import heapq
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+ROLES = ("kiosk", "tablet")
+
+Message = Union[str, bytes]
+# deliver(session, role, message, status): hand a message to the local socket for role
+Deliver = Callable[[str, str, Message, bool], Awaitable[None]]
+
+
+class SessionLimitError(Exception):
+    """Raised by create() when max_live sessions exist and none can be evicted."""
+
+
+class SessionStore:
+    name = "base"
+
+    def __init__(self, ttl: float = 600.0, max_live: int = 10000, evict_min_age: float = 60.0):
+        self.ttl = ttl
+        self.max_live = max_live
+        self.evict_min_age = evict_min_age
+        self.stats = {"expired": 0, "evicted": 0, "rejected": 0}
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def close(self):
+        pass
+
+    async def create(self, sid: str) -> None:
+        """Register a new session; raises SessionLimitError when full."""
+        raise NotImplementedError
+
+    async def count(self) -> int:
+        """Live sessions (all workers for shared backends)."""
+        raise NotImplementedError
+
+    async def sweep(self) -> int:
+        """Drop sessions whose TTL has passed; returns how many were removed."""
+        raise NotImplementedError
+
+    async def exists(self, sid: str) -> bool:
+        raise NotImplementedError
+
+    async def claim(self, sid: str, role: str) -> bool:
+        """Take the role slot. False if the session is unknown or the slot is taken."""
+        raise NotImplementedError
+
+    async def release(self, sid: str, role: str) -> bool:
+        """Free the role slot. True if the session is now empty and was removed."""
+        raise NotImplementedError
+
+    async def subscribe(self, sid: str, role: str):
+        """Start receiving messages addressed to (sid, role) on this worker."""
+        raise NotImplementedError
+
+    async def unsubscribe(self, sid: str, role: str):
+        raise NotImplementedError
+
+    async def publish(self, sid: str, role: str, message: Message, status: bool = False) -> bool:
+        """Send to the peer holding (sid, role), wherever it is. False if nobody is listening."""
+        raise NotImplementedError
+
+
+# ---------------- In-memory (single worker) ----------------
+class InMemorySessionStore(SessionStore):
+    name = "memory"
+
+    def __init__(self, **limits):
+        super().__init__(**limits)
+        # sessions[sid] = {"kiosk": taken?, "tablet": taken?, "created": t, "expires": t|None}
+        # expires is None once a peer has joined (pinned until both leave)
+        self.sessions: Dict[str, dict] = {}
+        # (expires, sid) for sessions created unjoined; entries whose session has
+        # since been joined or removed are skipped lazily when they reach the top
+        self._expiry: List[Tuple[float, str]] = []
+        self._subs: Set[Tuple[str, str]] = set()
+
+    async def create(self, sid: str) -> None:
+        now = time.monotonic()
+        if len(self.sessions) >= self.max_live:
+            self._sweep(now)
+            if len(self.sessions) >= self.max_live and not self._evict_oldest(now):
+                self.stats["rejected"] += 1
+                raise SessionLimitError(f"{len(self.sessions)} live sessions")
+        expires = now + self.ttl
+        self.sessions[sid] = {"kiosk": False, "tablet": False, "created": now, "expires": expires}
+        heapq.heappush(self._expiry, (expires, sid))
+
+    async def count(self) -> int:
+        return len(self.sessions)
+
+    async def sweep(self) -> int:
+        return self._sweep(time.monotonic())
+
+    def _live(self, sid: str, now: float) -> Optional[dict]:
+        entry = self.sessions.get(sid)
+        if entry is None or (entry["expires"] is not None and entry["expires"] <= now):
+            return None
+        return entry
+
+    def _sweep(self, now: float) -> int:
+        removed = 0
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, sid = heapq.heappop(self._expiry)
+            entry = self.sessions.get(sid)
+            if entry is not None and entry["expires"] == expires:
+                del self.sessions[sid]
+                removed += 1
+        self.stats["expired"] += removed
+        return removed
+
+    def _evict_oldest(self, now: float) -> bool:
+        while self._expiry:
+            expires, sid = self._expiry[0]
+            entry = self.sessions.get(sid)
+            if entry is None or entry["expires"] != expires:
+                heapq.heappop(self._expiry)  # stale: joined or already gone
+                continue
+            if now - entry["created"] < self.evict_min_age:
+                return False
+            heapq.heappop(self._expiry)
+            del self.sessions[sid]
+            self.stats["evicted"] += 1
+            print(f"[session] evicted idle {sid} (at capacity)")
+            return True
+        return False
+
+    async def exists(self, sid: str) -> bool:
+        return self._live(sid, time.monotonic()) is not None
+
+    async def claim(self, sid: str, role: str) -> bool:
+        entry = self._live(sid, time.monotonic())
+        if entry is None or entry[role]:
+            return False
+        entry[role] = True
+        entry["expires"] = None
+        return True
+
+    async def release(self, sid: str, role: str) -> bool:
+        entry = self.sessions.get(sid)
+        if entry is None:
+            return False
+        entry[role] = False
+        if not entry["kiosk"] and not entry["tablet"]:
+            self.sessions.pop(sid, None)
+            return True
+        return False
+
+    async def subscribe(self, sid: str, role: str):
+        self._subs.add((sid, role))
+
+    async def unsubscribe(self, sid: str, role: str):
+        self._subs.discard((sid, role))
+
+    async def publish(self, sid: str, role: str, message: Message, status: bool = False) -> bool:
+        if (sid, role) not in self._subs:
+            return False
+        await self._deliver(sid, role, message, status)
+        return True
+
+
+# ---------------- Redis (multi-worker / multi-node) ----------------
+# Session hash fields: "created" plus one field per claimed role holding the
+# worker id. The key carries a Redis TTL while unjoined; a sorted set indexes
+# sessions by expiry so sweep() and the live count don't need KEYS/SCAN.
+# Claim/release are Lua scripts so they are atomic across workers.
+#   KEYS[1] = session hash, KEYS[2] = expiry index
+_CLAIM_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then return 0 end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('PEXPIRE', KEYS[1], ARGV[3])
+redis.call('ZADD', KEYS[2], ARGV[4], ARGV[5])
+return 1
+"""
+
+_RELEASE_LUA = """
+redis.call('HDEL', KEYS[1], ARGV[1])
+if redis.call('HEXISTS', KEYS[1], 'kiosk') == 0 and redis.call('HEXISTS', KEYS[1], 'tablet') == 0 then
+  redis.call('ZREM', KEYS[2], ARGV[2])
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Remove one index entry whose deadline passed; the hash may already be gone
+# via its own TTL. Claimed sessions get a fresh deadline on claim, so an entry
+# that is due here is either unjoined or held by a worker that died.
+_EXPIRE_LUA = """
+local score = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not score or tonumber(score) > tonumber(ARGV[2]) then return 0 end
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('DEL', KEYS[1])
+return 1
+"""
+
+# Pub/sub payloads carry a 1-byte kind prefix so text (plain or status) and binary survive the trip
+_TEXT, _STATUS, _BYTES = b"t", b"s", b"b"
+
+
+class RedisSessionStore(SessionStore):
+    name = "redis"
+
+    def __init__(self, url: Optional[str] = None, client=None, prefix: str = "imgmod",
+                 claimed_ttl: float = 86400.0, **limits):
+        super().__init__(**limits)
+        # Upper bound on a joined session's lifetime, so a crashed worker's
+        # claims don't pin a session forever
+        self.claimed_ttl = claimed_ttl
+        if client is None:
+            import redis.asyncio as redis  # optional dependency, only for this backend
+            client = redis.from_url(url or "redis://localhost:6379/0")
+        self.redis = client
+        self.prefix = prefix
+        self.worker_id = uuid.uuid4().hex[:8]
+        self._relay_prefix = f"{prefix}:relay:"
+        self._index = f"{prefix}:sessions"
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def _key(self, sid: str) -> str:
+        return f"{self.prefix}:session:{sid}"
+
+    def _channel(self, sid: str, role: str) -> str:
+        return f"{self._relay_prefix}{sid}:{role}"
+
+    async def start(self, deliver: Deliver):
+        await super().start(deliver)
+        self._pubsub = self.redis.pubsub()
+        # Always hold one subscription so the listener has a connection to read from
+        await self._pubsub.subscribe(f"{self.prefix}:worker:{self.worker_id}")
+        self._listener = asyncio.create_task(self._listen())
+        print(f"[session] redis store started (worker {self.worker_id})")
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        await self.redis.aclose()
+
+    async def _listen(self):
+        while True:
+            try:
+                async for msg in self._pubsub.listen():
+                    if msg["type"] != "message":
+                        continue
+                    channel = msg["channel"]
+                    if isinstance(channel, bytes):
+                        channel = channel.decode()
+                    if not channel.startswith(self._relay_prefix):
+                        continue
+                    sid, role = channel[len(self._relay_prefix):].rsplit(":", 1)
+                    data = msg["data"]
+                    kind = data[:1]
+                    message = data[1:] if kind == _BYTES else data[1:].decode("utf-8")
+                    try:
+                        await self._deliver(sid, role, message, kind == _STATUS)
+                    except Exception as e:
+                        print(f"[session] deliver failed {sid}/{role}: {e}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[session] redis listener error, retrying: {e}")
+                await asyncio.sleep(1.0)
+
+    async def create(self, sid: str) -> None:
+        now = time.time()
+        # Soft cap: checked per worker, so concurrent creates can overshoot slightly
+        if await self.count() >= self.max_live:
+            await self.sweep()
+            if await self.count() >= self.max_live and not await self._evict_oldest(now):
+                self.stats["rejected"] += 1
+                raise SessionLimitError("session limit reached")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(self._key(sid), "created", now)
+            pipe.pexpire(self._key(sid), max(1, int(self.ttl * 1000)))
+            pipe.zadd(self._index, {sid: now + self.ttl})
+            await pipe.execute()
+
+    async def count(self) -> int:
+        return await self.redis.zcard(self._index)
+
+    async def sweep(self) -> int:
+        now = time.time()
+        removed = 0
+        for sid in await self.redis.zrangebyscore(self._index, "-inf", now):
+            sid = sid.decode() if isinstance(sid, bytes) else sid
+            removed += await self.redis.eval(_EXPIRE_LUA, 2, self._key(sid), self._index, sid, now)
+        self.stats["expired"] += removed
+        return removed
+
+    async def _evict_oldest(self, now: float) -> bool:
+        oldest = await self.redis.zrange(self._index, 0, 0, withscores=True)
+        if not oldest:
+            return False
+        sid, deadline = oldest[0]
+        sid = sid.decode() if isinstance(sid, bytes) else sid
+        created = deadline - self.ttl
+        if now - created < self.evict_min_age:
+            return False
+        if await self.redis.hexists(self._key(sid), "kiosk") or await self.redis.hexists(self._key(sid), "tablet"):
+            return False
+        if await self.redis.eval(_EXPIRE_LUA, 2, self._key(sid), self._index, sid, deadline):
+            self.stats["evicted"] += 1
+            print(f"[session] evicted idle {sid} (at capacity)")
+            return True
+        return False
+
+    async def exists(self, sid: str) -> bool:
+        return bool(await self.redis.exists(self._key(sid)))
+
+    async def claim(self, sid: str, role: str) -> bool:
+        # Plain EVAL: only runs on connect/disconnect, and Redis caches the compiled script
+        deadline = time.time() + self.claimed_ttl
+        return bool(await self.redis.eval(
+            _CLAIM_LUA, 2, self._key(sid), self._index,
+            role, self.worker_id, int(self.claimed_ttl * 1000), deadline, sid,
+        ))
+
+    async def release(self, sid: str, role: str) -> bool:
+        return bool(await self.redis.eval(_RELEASE_LUA, 2, self._key(sid), self._index, role, sid))
+
+    async def subscribe(self, sid: str, role: str):
+        await self._pubsub.subscribe(self._channel(sid, role))
+
+    async def unsubscribe(self, sid: str, role: str):
+        await self._pubsub.unsubscribe(self._channel(sid, role))
+
+    async def publish(self, sid: str, role: str, message: Message, status: bool = False) -> bool:
+        if isinstance(message, str):
+            payload = (_STATUS if status else _TEXT) + message.encode("utf-8")
+        else:
+            payload = _BYTES + bytes(message)
+        return await self.redis.publish(self._channel(sid, role), payload) > 0
@@ -0,0 +1,55 @@
+"""
+In-process request coalescing ("single-flight").
+
+Concurrent calls with the same key share one upstream task: the first caller
+starts it, later callers wait on the same task and get the same result or the
+same exception. The upstream task is cancelled only when every waiter has gone
+away, so one impatient client can't kill a result others are waiting for.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[str, _Flight] = {}
+        self.stats = {"leaders": 0, "shared": 0}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run fn() once per key among concurrent callers.
+        Returns (result, shared) where shared is True if this caller piggybacked
+        on a call started by someone else.
+        """
+        flight = self._inflight.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._inflight[key] = flight
+            flight.task.add_done_callback(lambda _t, k=key, f=flight: self._forget(k, f))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["shared"] += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def _forget(self, key: str, flight: _Flight):
+        if self._inflight.get(key) is flight:
+            self._inflight.pop(key, None)
@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+
+# Backend modules are imported flat (as main.py does), so put Backend/ on the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Tests that import main get the offline stub provider and throwaway storage
+os.environ.setdefault("EDIT_PROVIDER", "stub")
+os.environ.setdefault("STUB_LATENCY_S", "0.01")
+os.environ.setdefault("STUB_JITTER_S", "0")
+os.environ.setdefault("PROVIDER_WARMUP", "0")
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("RESULT_STORE_DIR", tempfile.mkdtemp(prefix="imgmod-test-results-"))
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import main
+from scheduler import ModelScheduler
+
+
+class FakeRequest:
+    """Just enough of a Request for run_cancellable: receive() reports a disconnect once told to."""
+
+    def __init__(self):
+        self.gone = asyncio.Event()
+
+    async def receive(self):
+        await self.gone.wait()
+        return {"type": "http.disconnect"}
+
+
+def _edit(scheduler: ModelScheduler, started: list):
+    async def edit():
+        async def model_call():
+            started.append(1)
+            await asyncio.sleep(10)
+        return await scheduler.call(model_call)
+    return edit()
+
+
+def test_superseded_edit_answers_409():
+    async def scenario():
+        scheduler = ModelScheduler(max_inflight=2)
+        started = []
+        first = asyncio.create_task(main.run_cancellable(FakeRequest(), "SUPER", _edit(scheduler, started)))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(main.run_cancellable(FakeRequest(), "SUPER", asyncio.sleep(0.01, "new")))
+        with pytest.raises(HTTPException) as raised:
+            await first
+        return raised.value, await second, scheduler.snapshot()
+
+    before = dict(main.cancel_stats)
+    error, result, snap = asyncio.run(scenario())
+    assert error.status_code == 409 and result == "new"
+    assert main.cancel_stats["superseded"] == before["superseded"] + 1
+    assert snap["inflight"] == 0 and snap["cancelled_running"] == 1
+    assert "SUPER" not in main.session_edits
+
+
+def test_disconnect_answers_499_and_frees_the_scheduler():
+    async def scenario():
+        # One edit holds the only slot, the other waits for it
+        scheduler = ModelScheduler(max_inflight=1)
+        started = []
+        requests = [FakeRequest(), FakeRequest()]
+        edits = [asyncio.create_task(main.run_cancellable(r, None, _edit(scheduler, started))) for r in requests]
+        await asyncio.sleep(0.01)
+        busy = scheduler.snapshot()
+        for r in requests:
+            r.gone.set()
+        results = await asyncio.gather(*edits, return_exceptions=True)
+        await asyncio.sleep(0.01)  # run_cancellable answers without waiting for the edits to unwind
+        return busy, results, started, scheduler.snapshot()
+
+    before = dict(main.cancel_stats)
+    busy, results, started, snap = asyncio.run(scenario())
+    assert busy["inflight"] == 1 and busy["queued"] == 1
+    assert all(isinstance(r, HTTPException) and r.status_code == 499 for r in results)
+    assert main.cancel_stats["disconnect"] == before["disconnect"] + 2
+    # The queued edit never reached the model; nothing is left behind
+    assert len(started) == 1
+    assert snap["inflight"] == 0 and snap["queued"] == 0
+    assert snap["cancelled_running"] == 1 and snap["cancelled_queued"] == 1
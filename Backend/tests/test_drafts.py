@@ -0,0 +1,118 @@
+import io
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import main
+from workpool import ImagePool
+
+
+@pytest.fixture(scope="module")
+def client():
+    with pytest.MonkeyPatch.context() as mp:
+        # The app's shutdown stops its image pool; give it one of its own
+        mp.setattr(main, "image_pool", ImagePool("thread", 2))
+        with TestClient(main.app) as client:
+            yield client
+
+
+def _png(size=(800, 600)) -> bytes:
+    # Larger than PREVIEW_MAX_EDGE, so the full-res edit isn't the preview's cache entry
+    buf = io.BytesIO()
+    Image.new("RGB", size, (90, 120, 200)).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _preview(client, image: bytes = None) -> str:
+    # A fresh prompt each time, so nothing is answered from the edit cache
+    response = client.post("/api/edit", params={"preview": 1},
+                           files={"image_file": ("photo.png", image or _png(), "image/png")},
+                           data={"prompt": f"beach {uuid.uuid4().hex}"})
+    assert response.status_code == 200, response.text
+    return response.headers["X-Draft-Id"]
+
+
+def _wait_for(predicate, timeout: float = 3.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def _job_status(client, job_id: str) -> str:
+    return client.get(f"/api/jobs/{job_id}").json()["status"]
+
+
+def test_confirm_is_idempotent(client):
+    before = dict(main.draft_stats)
+    draft_id = _preview(client)
+
+    first = client.post(f"/api/drafts/{draft_id}/confirm")
+    second = client.post(f"/api/drafts/{draft_id}/confirm")
+    assert first.status_code == second.status_code == 202
+    assert first.json()["jobId"] == second.json()["jobId"]
+    assert main.draft_stats["confirmed"] == before["confirmed"] + 1
+    # The upload is handed to the job, the draft no longer holds it
+    assert main.drafts[draft_id]["source"] is None
+    assert main.draft_stats["bytes"] == before["bytes"]
+
+    job_id = first.json()["jobId"]
+    _wait_for(lambda: _job_status(client, job_id) == "DONE")
+    assert client.get(f"/api/jobs/{job_id}/result").status_code == 200
+    assert client.delete(f"/api/drafts/{draft_id}").status_code == 200
+
+
+def test_discard_cancels_full_resolution_job(client, monkeypatch):
+    before = dict(main.draft_stats)
+    draft_id = _preview(client)
+    monkeypatch.setattr(main.provider, "latency_s", 10)
+
+    job_id = client.post(f"/api/drafts/{draft_id}/confirm").json()["jobId"]
+    assert client.delete(f"/api/drafts/{draft_id}").json() == {"draftId": draft_id, "status": "DISCARDED"}
+    _wait_for(lambda: _job_status(client, job_id) == "CANCELLED")
+
+    assert draft_id not in main.drafts
+    assert client.post(f"/api/drafts/{draft_id}/confirm").status_code == 404
+    assert client.delete(f"/api/drafts/{draft_id}").status_code == 404
+    assert main.draft_stats["discarded"] == before["discarded"] + 1
+
+
+def test_unconfirmed_draft_expires(client, monkeypatch):
+    monkeypatch.setattr(main, "DRAFT_TTL_S", 0.1)
+    before = dict(main.draft_stats)
+    draft_id = _preview(client)
+
+    _wait_for(lambda: draft_id not in main.drafts)
+    assert client.post(f"/api/drafts/{draft_id}/confirm").status_code == 404
+    assert main.draft_stats["expired"] == before["expired"] + 1
+    assert main.draft_stats["bytes"] == before["bytes"]
+
+
+def test_byte_cap_drops_oldest_draft(client, monkeypatch):
+    image = _png()
+    monkeypatch.setattr(main, "DRAFT_MAX_BYTES", len(image) * 3 // 2)
+    before = dict(main.draft_stats)
+
+    old = _preview(client, image)
+    new = _preview(client, image)
+    assert old not in main.drafts and new in main.drafts
+    assert main.draft_stats["expired"] == before["expired"] + 1
+    assert main.draft_stats["bytes"] == before["bytes"] + len(image)
+    client.delete(f"/api/drafts/{new}")
+
+
+def test_confirmed_draft_expiring_is_not_counted_as_expired(client, monkeypatch):
+    monkeypatch.setattr(main, "DRAFT_TTL_S", 0.3)
+    before = dict(main.draft_stats)
+    draft_id = _preview(client)
+    job_id = client.post(f"/api/drafts/{draft_id}/confirm").json()["jobId"]
+
+    _wait_for(lambda: draft_id not in main.drafts)
+    # Timing out only cleans the draft up: the job is left alone
+    _wait_for(lambda: _job_status(client, job_id) == "DONE")
+    assert main.draft_stats["confirmed"] == before["confirmed"] + 1
+    assert main.draft_stats["expired"] == before["expired"]
+    assert main.draft_stats["discarded"] == before["discarded"]
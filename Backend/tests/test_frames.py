@@ -0,0 +1,51 @@
+import zlib
+
+import pytest
+
+from frames import FLAG_DEFLATE, FrameError, frame_payload, frame_to_json, pack_frame, unpack_header
+
+
+def test_roundtrip_untouched_payload():
+    buf = pack_frame("RESULT", b"\x89PNG...", "image/png")
+    header = unpack_header(buf)
+    assert (header.type, header.mime, header.flags) == ("RESULT", "image/png", 0)
+    assert frame_payload(buf, header) == b"\x89PNG..."
+
+
+def test_deflate_payload_is_inflated():
+    buf = pack_frame("RESULT", b"abc" * 1000, "image/png", compress=True)
+    header = unpack_header(buf)
+    assert header.flags & FLAG_DEFLATE
+    assert frame_payload(buf, header) == b"abc" * 1000
+    assert frame_to_json(buf, header)["dataUrl"].startswith("data:image/png;base64,")
+
+
+def test_inflate_is_capped():
+    # ~100 KB on the wire, 100 MB once inflated
+    buf = pack_frame("RESULT", b"\0" * (100 * 1024 * 1024), compress=True)
+    header = unpack_header(buf)
+    with pytest.raises(FrameError, match="exceeds"):
+        frame_payload(buf, header, max_size=1024 * 1024)
+    with pytest.raises(FrameError, match="exceeds"):
+        frame_to_json(buf, header, max_size=1024 * 1024)
+
+
+def test_payload_at_the_cap_is_accepted():
+    buf = pack_frame("RESULT", b"a" * 100, compress=True)
+    assert frame_payload(buf, unpack_header(buf), max_size=100) == b"a" * 100
+    with pytest.raises(FrameError):
+        frame_payload(buf, unpack_header(buf), max_size=99)
+
+
+def test_truncated_deflate_stream():
+    truncated = zlib.compress(b"x" * 1000)[:-5]
+    buf = bytearray(pack_frame("RESULT", truncated))
+    buf[1] = FLAG_DEFLATE
+    with pytest.raises(FrameError, match="truncated"):
+        frame_payload(bytes(buf), unpack_header(bytes(buf)))
+
+
+@pytest.mark.parametrize("buf", [b"", b"\x02\x00\x01A\x00\x00\x00\x00\x00", pack_frame("A", b"xy")[:-1]])
+def test_malformed_headers(buf):
+    with pytest.raises(FrameError):
+        unpack_header(buf)
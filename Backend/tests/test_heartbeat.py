@@ -0,0 +1,143 @@
+import asyncio
+from collections import Counter
+
+from heartbeat import HeartbeatScheduler
+
+
+class FakeSocket:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+def _scheduler(interval: float = 0.1, slots: int = 5, max_missed: int = 2, answer=()):
+    """Scheduler with recording callbacks; sockets in `answer` PONG every ping."""
+    pings, dead = Counter(), []
+    holder = {}
+
+    async def send_ping(sock):
+        pings[sock] += 1
+        if sock in answer:
+            holder["hb"].pong(sock)
+
+    async def on_dead(sock):
+        dead.append(sock)
+
+    hb = HeartbeatScheduler(send_ping, on_dead, interval=interval, slots=slots, max_missed=max_missed)
+    holder["hb"] = hb
+    return hb, pings, dead
+
+
+async def _run_for(hb: HeartbeatScheduler, seconds: float):
+    task = asyncio.create_task(hb.run())
+    await asyncio.sleep(seconds)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_register_goes_behind_the_cursor():
+    hb, _, _ = _scheduler(slots=5)
+    a = FakeSocket("a")
+    hb.register(a)
+    assert hb._slot[a] == 4 and a in hb._wheel[4]
+    hb._cursor = 2
+    b = FakeSocket("b")
+    hb.register(b)
+    assert hb._slot[b] == 1
+    hb.unregister(a)
+    assert len(hb) == 1 and a not in hb._wheel[4]
+
+
+def test_each_socket_pinged_once_per_interval():
+    hb, pings, dead = _scheduler(interval=0.1, slots=5)
+    socks = [FakeSocket(f"s{i}") for i in range(3)]
+    for sock in socks:
+        hb.register(sock)
+
+    # First ping after one interval, then one per interval: 2 within 0.25s
+    asyncio.run(_run_for(hb, 0.25))
+    assert all(pings[s] == 2 for s in socks), pings
+    assert dead == [] and hb.stats["pings"] == 6
+
+
+def test_sockets_registered_later_land_in_other_buckets():
+    async def scenario():
+        hb, pings, _ = _scheduler(interval=0.1, slots=5)
+        first, later = FakeSocket("first"), FakeSocket("later")
+        hb.register(first)
+        task = asyncio.create_task(hb.run())
+        await asyncio.sleep(0.05)  # cursor has moved on
+        hb.register(later)
+        await asyncio.sleep(0.01)
+        slots = hb._slot[first], hb._slot[later]
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return slots
+
+    first_slot, later_slot = asyncio.run(scenario())
+    assert first_slot != later_slot
+
+
+def test_silent_pong_client_is_evicted_after_max_missed():
+    hb, pings, dead = _scheduler(interval=0.05, slots=1, max_missed=2)
+    silent = FakeSocket("silent")
+    hb.register(silent)
+    hb.pong(silent)  # tracked from now on, then never answers again
+
+    asyncio.run(_run_for(hb, 0.2))
+    # Two unanswered pings, the third round declares it dead
+    assert pings[silent] == 2
+    assert dead == [silent]
+    assert len(hb) == 0 and hb.stats["dead"] == 1
+
+
+def test_answering_and_untracked_clients_stay():
+    answering, legacy = FakeSocket("answering"), FakeSocket("legacy")
+    hb, pings, dead = _scheduler(interval=0.05, slots=1, max_missed=1, answer={answering})
+    hb.register(answering)
+    hb.register(legacy)  # never sends PONG: pinged only, never evicted
+    hb.pong(answering)
+
+    asyncio.run(_run_for(hb, 0.22))
+    assert dead == []
+    assert pings[answering] >= 3 and pings[legacy] >= 3
+    assert hb.snapshot()["tracked"] == 1
+
+
+def test_any_inbound_message_resets_missed_count():
+    async def scenario():
+        hb, pings, dead = _scheduler(interval=0.05, slots=1, max_missed=2)
+        chatty = FakeSocket("chatty")
+        hb.register(chatty)
+        hb.pong(chatty)
+        task = asyncio.create_task(hb.run())
+        for _ in range(6):
+            await asyncio.sleep(0.03)
+            hb.seen(chatty)  # relayed messages, no PONG
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return pings[chatty], dead
+
+    pinged, dead = asyncio.run(scenario())
+    assert pinged >= 3 and dead == []
+
+
+def test_failing_callbacks_do_not_stop_the_loop():
+    async def scenario():
+        pinged = []
+
+        async def send_ping(sock):
+            pinged.append(sock)
+            raise ConnectionError("socket gone")
+
+        async def on_dead(sock):
+            pass
+
+        hb = HeartbeatScheduler(send_ping, on_dead, interval=0.05, slots=1)
+        hb.register(FakeSocket("broken"))
+        await _run_for(hb, 0.12)
+        return pinged
+
+    assert len(asyncio.run(scenario())) == 2
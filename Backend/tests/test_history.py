@@ -0,0 +1,40 @@
+from history import ResultHistory
+
+
+def test_disabled_history_keeps_nothing():
+    history = ResultHistory(per_session_entries=0)
+    assert history.add("s1", b"result", "image/png") is None
+    assert history.get("s1", "last") is None
+    assert history.snapshot()["entries"] == 0
+
+
+def test_per_session_entry_limit():
+    history = ResultHistory(per_session_entries=2)
+    ids = [history.add("s1", bytes([i]) * 10, "image/png") for i in range(3)]
+    assert history.get("s1", ids[0]) is None
+    assert history.get("s1", "last")[0] == ids[2]
+    assert history.snapshot()["evicted"] == 1
+
+
+def test_global_limit_evicts_least_recently_used():
+    history = ResultHistory(per_session_entries=8, max_bytes=20)
+    a = history.add("s1", b"a" * 10, "image/png")
+    b = history.add("s2", b"b" * 10, "image/png")
+    history.get("s1", a)
+    c = history.add("s3", b"c" * 10, "image/png")
+    assert history.get("s2", b) is None
+    assert history.get("s1", a) is not None and history.get("s3", c) is not None
+    assert history.snapshot()["bytes"] == 20
+
+
+def test_oversized_result_is_not_kept():
+    history = ResultHistory(per_session_bytes=10)
+    assert history.add("s1", b"x" * 11, "image/png") is None
+    assert history.sessions() == []
+
+
+def test_drop_session():
+    history = ResultHistory()
+    history.add("s1", b"x", "image/png")
+    history.drop("s1")
+    assert history.sessions() == [] and history.snapshot()["bytes"] == 0
@@ -0,0 +1,57 @@
+import asyncio
+import io
+
+from PIL import Image
+
+import main
+
+
+def _png(color=(10, 200, 30)) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_job_done_while_broadcasting_is_not_evicted(monkeypatch):
+    """A job still pushing its DONE event (slow publish, e.g. Redis) isn't finished yet."""
+    monkeypatch.setattr(main, "JOB_MAX_FINISHED", 1)
+
+    async def slow_publish(session, role, message, status=False):
+        if session == "SLOW" and '"DONE"' in message:
+            await asyncio.sleep(0.3)
+        return False
+
+    monkeypatch.setattr(main.session_store, "publish", slow_publish)
+
+    async def scenario():
+        slow = await main.start_job(_png(), "beach", "SLOW")
+        await asyncio.sleep(0.15)  # SLOW is now DONE and stuck in its broadcast
+        fast = await main.start_job(_png((1, 2, 3)), "city", "FAST")
+        tasks = [slow["task"], fast["task"]]
+        await asyncio.gather(*tasks)
+        return slow, fast
+
+    slow, fast = asyncio.run(scenario())
+    assert slow["status"] == "DONE" and slow["finished"]
+    # Eviction keeps the job that finished last
+    assert slow["id"] in main.jobs and fast["id"] not in main.jobs
+    main.drop_job(slow["id"])
+
+
+def test_finished_jobs_are_capped(monkeypatch):
+    monkeypatch.setattr(main, "JOB_MAX_FINISHED", 2)
+
+    async def scenario():
+        started = []
+        for i in range(4):
+            job = await main.start_job(_png((i, i, i)), f"p{i}", None)
+            await job["task"]
+            started.append(job)
+        return started
+
+    started = asyncio.run(scenario())
+    kept = [job["id"] in main.jobs for job in started]
+    assert kept == [False, False, True, True]
+    assert main.job_stats["bytes"] == sum(len(job["data"]) for job in started[2:])
+    for job in started[2:]:
+        main.drop_job(job["id"])
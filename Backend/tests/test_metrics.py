@@ -0,0 +1,15 @@
+import asyncio
+
+import main
+
+
+def test_metrics_export_store_and_pool_state():
+    body = asyncio.run(main.metrics_endpoint()).body.decode()
+    lines = body.splitlines()
+    for what in ("expired", "evicted", "rejected"):
+        assert f'imgmod_session_store{{what="{what}"}} {main.session_store.stats[what]}' in lines
+    assert any(line.startswith('imgmod_result_store{what="bytes"} ') for line in lines)
+    assert any(line.startswith('imgmod_result_store{what="evicted_age"} ') for line in lines)
+    assert f'imgmod_image_pool{{what="workers"}} {main.image_pool.workers}' in lines
+    # Non-numeric fields (the pool mode) are left out
+    assert 'what="mode"' not in body
@@ -0,0 +1,40 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import main
+from sendqueue import SendQueue
+
+
+def test_only_flagged_status_messages_coalesce(monkeypatch):
+    async def scenario():
+        async def send(message):
+            pass
+
+        async def on_overflow():
+            pass
+
+        # Writer not started: everything stays queued
+        outbox = SendQueue(send, on_overflow, policy="coalesce")
+        ws = SimpleNamespace(state=SimpleNamespace(outbox=outbox))
+        monkeypatch.setitem(main.rooms, "RELAY", {"kiosk": ws, "tablet": None})
+
+        offline = json.dumps({"type": "PEER_STATUS", "role": "tablet", "status": "offline"})
+        online = json.dumps({"type": "PEER_STATUS", "role": "tablet", "status": "online"})
+        await main._deliver_local("RELAY", "kiosk", offline, True)
+        # A tablet relaying text that looks like a status message is still a payload
+        await main._deliver_local("RELAY", "kiosk", offline, False)
+        await main._deliver_local("RELAY", "kiosk", online, True)
+        main._queue_json(ws, {"type": "PING", "ts": 1}, status=True)
+        main._queue_json(ws, {"type": "PING", "ts": 2}, status=True)
+        main._queue_json(ws, {"type": "ERROR", "message": "kiosk not connected"})
+        return [json.loads(message) for message, _ in outbox._items], outbox.stats
+
+    queued, stats = asyncio.run(scenario())
+    assert [(m["type"], m.get("status"), m.get("ts")) for m in queued] == [
+        ("PEER_STATUS", "offline", None),
+        ("PEER_STATUS", "online", None),
+        ("PING", None, 2),
+        ("ERROR", None, None),
+    ]
+    assert stats["coalesced"] == 2
@@ -0,0 +1,68 @@
+import asyncio
+import os
+
+from result_store import ResultStore
+
+
+def test_put_and_get(tmp_path):
+    store = ResultStore(str(tmp_path), max_bytes=1024, max_age_s=60)
+    rid = asyncio.run(store.put(b"png bytes", "image/png"))
+    stored = store.get(rid)
+    assert stored.media_type == "image/png"
+    with open(stored.path, "rb") as f:
+        assert f.read() == b"png bytes"
+    assert store.get("0" * 64) is None
+
+
+def test_concurrent_identical_puts_write_once(tmp_path):
+    store = ResultStore(str(tmp_path), max_bytes=1024, max_age_s=60)
+
+    async def scenario():
+        return await asyncio.gather(*(store.put(b"same result", "image/png") for _ in range(6)))
+
+    ids = asyncio.run(scenario())
+    assert len(set(ids)) == 1
+    snap = store.snapshot()
+    assert snap["entries"] == 1 and snap["stored"] == 1 and snap["refreshed"] == 5
+    assert snap["bytes"] == len(b"same result")
+    assert os.listdir(tmp_path) == [f"{ids[0]}.png"]
+
+
+def test_cancelled_put_still_stores(tmp_path):
+    store = ResultStore(str(tmp_path), max_bytes=1024, max_age_s=60)
+
+    async def scenario():
+        first = asyncio.create_task(store.put(b"result", "image/png"))
+        second = asyncio.create_task(store.put(b"result", "image/png"))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    rid = asyncio.run(scenario())
+    assert store.get(rid) is not None and store.snapshot()["bytes"] == len(b"result")
+
+
+def test_size_eviction_oldest_first(tmp_path):
+    store = ResultStore(str(tmp_path), max_bytes=25, max_age_s=60)
+
+    async def scenario():
+        return [await store.put(bytes([i]) * 10, "image/png") for i in range(3)]
+
+    ids = asyncio.run(scenario())
+    assert store.get(ids[0]) is None
+    assert store.get(ids[1]) is not None and store.get(ids[2]) is not None
+    assert store.snapshot()["bytes"] == 20 and store.snapshot()["evicted_size"] == 1
+
+
+def test_index_survives_restart(tmp_path):
+    rid = asyncio.run(ResultStore(str(tmp_path), 1024, 60).put(b"kept", "image/webp"))
+    reopened = ResultStore(str(tmp_path), 1024, 60)
+    assert reopened.get(rid).media_type == "image/webp"
+    assert reopened.snapshot()["bytes"] == 4
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    store = ResultStore(str(tmp_path), max_bytes=1024, max_age_s=0)
+    rid = asyncio.run(store.put(b"old", "image/png"))
+    assert store.get(rid) is None
+    assert os.listdir(tmp_path) == []
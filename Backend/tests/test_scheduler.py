@@ -0,0 +1,206 @@
+import asyncio
+
+import pytest
+
+from scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, DeadlineExceeded, ModelScheduler, UpstreamBusy
+
+
+class Busy(Exception):
+    pass
+
+
+async def _hold(scheduler: ModelScheduler, release: asyncio.Event) -> asyncio.Task:
+    """Occupy one slot until `release` is set."""
+    task = asyncio.create_task(scheduler.call(release.wait))
+    await asyncio.sleep(0)
+    return task
+
+
+def test_priority_order_then_fifo():
+    async def scenario():
+        scheduler = ModelScheduler(max_inflight=1)
+        release = asyncio.Event()
+        blocker = await _hold(scheduler, release)
+        order = []
+
+        def record(name):
+            async def fn():
+                order.append(name)
+            return fn
+
+        calls = [
+            asyncio.create_task(scheduler.call(record("batch-1"), priority=PRIORITY_BATCH)),
+            asyncio.create_task(scheduler.call(record("interactive-1"), priority=PRIORITY_INTERACTIVE)),
+            asyncio.create_task(scheduler.call(record("batch-2"), priority=PRIORITY_BATCH)),
+            asyncio.create_task(scheduler.call(record("interactive-2"), priority=PRIORITY_INTERACTIVE)),
+        ]
+        await asyncio.sleep(0)
+        assert scheduler.snapshot()["queued_by_priority"] == {PRIORITY_INTERACTIVE: 2, PRIORITY_BATCH: 2}
+
+        release.set()
+        await asyncio.gather(blocker, *calls)
+        return order, scheduler.snapshot()
+
+    order, snap = asyncio.run(scenario())
+    assert order == ["interactive-1", "interactive-2", "batch-1", "batch-2"]
+    assert snap["inflight"] == 0 and snap["queued"] == 0 and snap["calls"] == 5
+
+
+def test_deadline_while_queued_leaves_the_queue():
+    async def scenario():
+        scheduler = ModelScheduler(max_inflight=1)
+        release = asyncio.Event()
+        blocker = await _hold(scheduler, release)
+        with pytest.raises(DeadlineExceeded):
+            await scheduler.call(lambda: asyncio.sleep(0), timeout=0.05)
+        queued = scheduler.snapshot()["queued"]
+        release.set()
+        await blocker
+        return queued, scheduler.snapshot()
+
+    queued, snap = asyncio.run(scenario())
+    assert queued == 0
+    assert snap["deadline_expired"] == 1
+    assert snap["calls"] == 1 and snap["inflight"] == 0
+
+
+def test_deadline_while_running_frees_the_slot():
+    async def scenario():
+        scheduler = ModelScheduler(max_inflight=1)
+        with pytest.raises(DeadlineExceeded):
+            await scheduler.call(lambda: asyncio.sleep(10), timeout=0.05)
+        # The slot is free again: the next call runs right away
+        assert await scheduler.call(lambda: asyncio.sleep(0, "ok"), timeout=1) == "ok"
+        return scheduler.snapshot()
+
+    snap = asyncio.run(scenario())
+    assert snap["deadline_expired"] == 1 and snap["inflight"] == 0
+
+
+def test_provider_timeout_is_not_our_deadline():
+    async def scenario():
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            raise TimeoutError("provider read timeout")
+
+        plain = ModelScheduler(max_inflight=1)
+        with pytest.raises(TimeoutError) as raised:
+            await plain.call(fn, timeout=5)
+        retrying = ModelScheduler(max_inflight=1, max_retries=1, backoff_base=0.01,
+                                  is_retryable=lambda e: isinstance(e, TimeoutError))
+        with pytest.raises(UpstreamBusy):
+            await retrying.call(fn, timeout=5)
+        return raised.value, calls, plain.snapshot(), retrying.snapshot()
+
+    error, calls, plain, retrying = asyncio.run(scenario())
+    assert not isinstance(error, DeadlineExceeded)
+    assert len(calls) == 3
+    assert plain["deadline_expired"] == 0 and retrying["deadline_expired"] == 0
+    assert retrying["retries"] == 1 and retrying["gave_up"] == 1
+
+
+def test_cancel_while_running_releases_slot():
+    async def scenario():
+        scheduler = ModelScheduler(max_inflight=1)
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(scheduler.call(slow))
+        await started.wait()
+        assert scheduler.snapshot()["inflight"] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return scheduler.snapshot()
+
+    snap = asyncio.run(scenario())
+    assert snap["inflight"] == 0 and snap["cancelled_running"] == 1
+
+
+def test_cancel_while_queued_leaves_the_queue():
+    async def scenario():
+        scheduler = ModelScheduler(max_inflight=1)
+        release = asyncio.Event()
+        blocker = await _hold(scheduler, release)
+        ran = []
+        queued = asyncio.create_task(scheduler.call(lambda: asyncio.sleep(0, ran.append("queued"))))
+        await asyncio.sleep(0)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        after_cancel = scheduler.snapshot()
+
+        release.set()
+        await blocker
+        await scheduler.call(lambda: asyncio.sleep(0))
+        return ran, after_cancel, scheduler.snapshot()
+
+    ran, after_cancel, snap = asyncio.run(scenario())
+    assert ran == []
+    assert after_cancel["queued"] == 0 and after_cancel["cancelled_queued"] == 1
+    assert snap["inflight"] == 0 and snap["calls"] == 2
+
+
+def test_retry_succeeds_after_busy():
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Busy("429")
+        return "ok"
+
+    scheduler = ModelScheduler(max_retries=3, backoff_base=0.001, backoff_max=0.001,
+                               is_retryable=lambda e: isinstance(e, Busy))
+    assert asyncio.run(scheduler.call(flaky)) == "ok"
+    assert len(attempts) == 3
+    assert scheduler.stats["retries"] == 2 and scheduler.stats["gave_up"] == 0
+
+
+def test_retry_gives_up_after_max_retries():
+    attempts = []
+
+    async def busy():
+        attempts.append(1)
+        raise Busy("503")
+
+    scheduler = ModelScheduler(max_retries=2, backoff_base=0.001, backoff_max=0.001,
+                               is_retryable=lambda e: isinstance(e, Busy))
+    with pytest.raises(UpstreamBusy) as err:
+        asyncio.run(scheduler.call(busy))
+    assert isinstance(err.value.cause, Busy)
+    assert len(attempts) == 3
+    assert scheduler.stats["retries"] == 2 and scheduler.stats["gave_up"] == 1
+    assert scheduler.snapshot()["inflight"] == 0
+
+
+def test_retry_gives_up_when_backoff_passes_deadline(monkeypatch):
+    attempts = []
+
+    async def busy():
+        attempts.append(1)
+        raise Busy("429")
+
+    # Full jitter picks the top of the range: a 10s backoff can't fit in 0.2s
+    monkeypatch.setattr("scheduler.random.uniform", lambda a, b: b)
+    scheduler = ModelScheduler(max_retries=5, backoff_base=10, backoff_max=10,
+                               is_retryable=lambda e: isinstance(e, Busy))
+    with pytest.raises(UpstreamBusy) as err:
+        asyncio.run(scheduler.call(busy, timeout=0.2))
+    assert len(attempts) == 1
+    assert err.value.retry_after == 10
+
+
+def test_non_retryable_error_is_raised_as_is():
+    async def broken():
+        raise ValueError("bad request")
+
+    scheduler = ModelScheduler(is_retryable=lambda e: isinstance(e, Busy))
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.call(broken))
+    assert scheduler.stats["retries"] == 0 and scheduler.snapshot()["inflight"] == 0
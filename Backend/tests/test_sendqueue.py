@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from sendqueue import SendQueue
+
+
+def _queue(policy: str, max_messages: int = 3, max_bytes: int = 1024):
+    """A queue whose writer never starts, so messages stay queued; records drops and overflows."""
+    sent, drops, overflows = [], [], []
+
+    async def send(message):
+        sent.append(message)
+
+    async def on_overflow():
+        overflows.append(1)
+
+    queue = SendQueue(send, on_overflow, max_messages=max_messages, max_bytes=max_bytes,
+                      policy=policy, on_drop=drops.append)
+    return queue, sent, drops, overflows
+
+
+def _queued(queue: SendQueue) -> list:
+    return [message for message, _ in queue._items]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        _queue("block")
+
+
+def test_drop_oldest():
+    async def scenario():
+        queue, _, drops, _ = _queue("drop_oldest")
+        for i in range(5):
+            assert queue.put(f"m{i}", key="same")  # keys are ignored by this policy
+        return queue, drops
+
+    queue, drops = asyncio.run(scenario())
+    assert _queued(queue) == ["m2", "m3", "m4"]
+    assert drops == ["overflow", "overflow"]
+    assert queue.stats["dropped"] == 2 and queue.stats["coalesced"] == 0
+
+
+def test_coalesce_replaces_same_key_and_moves_it_back():
+    async def scenario():
+        queue, _, drops, _ = _queue("coalesce")
+        queue.put("status-1", key=("PEER_STATUS", "kiosk"))
+        queue.put("payload")
+        queue.put("status-2", key=("PEER_STATUS", "kiosk"))
+        return queue, drops
+
+    queue, drops = asyncio.run(scenario())
+    assert _queued(queue) == ["payload", "status-2"]
+    assert drops == ["coalesced"]
+    assert queue.stats["coalesced"] == 1 and queue.stats["dropped"] == 0
+
+
+def test_coalesce_falls_back_to_drop_oldest():
+    async def scenario():
+        queue, _, drops, _ = _queue("coalesce")
+        for i in range(4):
+            queue.put(f"m{i}")
+        return queue, drops
+
+    queue, drops = asyncio.run(scenario())
+    assert _queued(queue) == ["m1", "m2", "m3"]
+    assert drops == ["overflow"]
+
+
+def test_byte_limit_keeps_newest_message():
+    async def scenario():
+        queue, _, _, _ = _queue("drop_oldest", max_messages=10, max_bytes=10)
+        queue.put(b"12345")
+        queue.put(b"67890")
+        queue.put(b"x" * 50)  # alone over max_bytes, still kept
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert _queued(queue) == [b"x" * 50]
+    assert queue.snapshot()["bytes"] == 50
+
+
+def test_disconnect_closes_and_calls_on_overflow():
+    async def scenario():
+        queue, _, drops, overflows = _queue("disconnect")
+        results = [queue.put(f"m{i}") for i in range(4)]
+        await asyncio.sleep(0)  # on_overflow runs as its own task
+        refused = queue.put("after")
+        return queue, drops, overflows, results, refused
+
+    queue, drops, overflows, results, refused = asyncio.run(scenario())
+    assert results == [True, True, True, False]
+    assert refused is False
+    assert queue.closed and len(queue) == 0
+    assert drops == ["disconnect"] and overflows == [1]
+
+
+def test_writer_sends_in_order():
+    async def scenario():
+        queue, sent, _, _ = _queue("coalesce")
+        queue.start()
+        queue.put("a")
+        queue.put(b"b")
+        await asyncio.sleep(0.01)
+        queue.put("c")
+        await asyncio.sleep(0.01)
+        queue.close()
+        return queue, sent
+
+    queue, sent = asyncio.run(scenario())
+    assert sent == ["a", b"b", "c"]
+    assert queue.stats["sent"] == 3
@@ -0,0 +1,178 @@
+import asyncio
+
+import pytest
+
+from session_store import InMemorySessionStore, RedisSessionStore, SessionLimitError
+
+
+class Backend:
+    """Builds stores of one kind; stores made by the same Backend share state (like two workers)."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.server = None
+        if kind == "redis":
+            fakeredis = pytest.importorskip("fakeredis")
+            pytest.importorskip("lupa")  # claim/release/expire are Lua scripts
+            self.server = fakeredis.FakeServer()
+
+    def store(self, **limits):
+        if self.kind == "memory":
+            return InMemorySessionStore(**limits)
+        from fakeredis import aioredis
+
+        return RedisSessionStore(client=aioredis.FakeRedis(server=self.server), prefix="test", **limits)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    return Backend(request.param)
+
+
+def run(backend: Backend, scenario, **limits):
+    """Start a store (collecting what it delivers), run scenario(store, delivered), close it."""
+    async def main():
+        store = backend.store(**limits)
+        delivered = []
+
+        async def deliver(sid, role, message, status):
+            delivered.append((sid, role, message, status))
+
+        await store.start(deliver)
+        try:
+            return await scenario(store, delivered)
+        finally:
+            await store.close()
+
+    return asyncio.run(main())
+
+
+def test_claim_and_duplicate_role(backend):
+    async def scenario(store, _):
+        await store.create("S1")
+        return [
+            await store.claim("S1", "kiosk"),
+            await store.claim("S1", "kiosk"),
+            await store.claim("S1", "tablet"),
+            await store.claim("NOPE", "kiosk"),
+        ]
+
+    assert run(backend, scenario) == [True, False, True, False]
+
+
+def test_release_of_last_role_removes_session(backend):
+    async def scenario(store, _):
+        await store.create("S1")
+        await store.claim("S1", "kiosk")
+        await store.claim("S1", "tablet")
+        first = await store.release("S1", "kiosk")
+        still_there = await store.exists("S1")
+        last = await store.release("S1", "tablet")
+        return first, still_there, last, await store.exists("S1"), await store.count()
+
+    assert run(backend, scenario) == (False, True, True, False, 0)
+
+
+def test_unjoined_sessions_expire(backend):
+    async def scenario(store, _):
+        await store.create("IDLE")
+        await store.create("JOINED")
+        await store.claim("JOINED", "kiosk")
+        await asyncio.sleep(0.15)
+        removed = await store.sweep()
+        return removed, await store.exists("IDLE"), await store.exists("JOINED"), await store.count(), store.stats
+
+    removed, idle, joined, count, stats = run(backend, scenario, ttl=0.1)
+    assert removed == 1 and not idle and joined and count == 1
+    assert stats["expired"] == 1
+
+
+def test_full_store_rejects_young_sessions(backend):
+    async def scenario(store, _):
+        await store.create("S1")
+        await store.create("S2")
+        with pytest.raises(SessionLimitError):
+            await store.create("S3")
+        return await store.count(), store.stats
+
+    count, stats = run(backend, scenario, max_live=2, evict_min_age=60)
+    assert count == 2 and stats["rejected"] == 1 and stats["evicted"] == 0
+
+
+def test_full_store_evicts_oldest_idle_session(backend):
+    async def scenario(store, _):
+        await store.create("OLD")
+        await asyncio.sleep(0.01)
+        await store.create("JOINED")
+        await store.claim("JOINED", "tablet")
+        await store.create("NEW")
+        return [await store.exists(s) for s in ("OLD", "JOINED", "NEW")], store.stats
+
+    exists, stats = run(backend, scenario, max_live=2, evict_min_age=0)
+    assert exists == [False, True, True]
+    assert stats["evicted"] == 1 and stats["rejected"] == 0
+
+
+def test_publish_reaches_subscriber(backend):
+    async def scenario(store, delivered):
+        await store.create("S1")
+        nobody = await store.publish("S1", "kiosk", "lost")
+        await store.subscribe("S1", "kiosk")
+        sent = [
+            await store.publish("S1", "kiosk", '{"type": "EDIT"}'),
+            await store.publish("S1", "kiosk", b"\x01frame"),
+            await store.publish("S1", "kiosk", '{"type": "PEER_STATUS"}', status=True),
+        ]
+        for _ in range(50):
+            if len(delivered) == 3:
+                break
+            await asyncio.sleep(0.01)
+        return nobody, sent, delivered
+
+    nobody, sent, delivered = run(backend, scenario)
+    assert nobody is False and sent == [True, True, True]
+    assert delivered == [
+        ("S1", "kiosk", '{"type": "EDIT"}', False),
+        ("S1", "kiosk", b"\x01frame", False),
+        ("S1", "kiosk", '{"type": "PEER_STATUS"}', True),
+    ]
+
+
+def test_publish_across_instances():
+    backend = Backend("redis")
+
+    async def main():
+        worker_a, worker_b = backend.store(), backend.store()
+        at_a, at_b = [], []
+
+        async def deliver_a(sid, role, message, status):
+            at_a.append((sid, role, message, status))
+
+        async def deliver_b(sid, role, message, status):
+            at_b.append((sid, role, message, status))
+
+        await worker_a.start(deliver_a)
+        await worker_b.start(deliver_b)
+        try:
+            await worker_a.create("S1")
+            # Kiosk is connected to worker A, tablet to worker B
+            assert await worker_a.claim("S1", "kiosk")
+            assert await worker_b.claim("S1", "tablet")
+            await worker_a.subscribe("S1", "kiosk")
+            await worker_b.subscribe("S1", "tablet")
+
+            assert await worker_b.publish("S1", "kiosk", "from tablet")
+            assert await worker_a.publish("S1", "tablet", b"\x01binary")
+            assert await worker_a.publish("S1", "tablet", '{"type": "JOB_STATUS"}', status=True)
+            for _ in range(50):
+                if at_a and len(at_b) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            return at_a, at_b
+        finally:
+            await worker_a.close()
+            await worker_b.close()
+
+    at_a, at_b = asyncio.run(main())
+    assert at_a == [("S1", "kiosk", "from tablet", False)]
+    assert at_b == [("S1", "tablet", b"\x01binary", False), ("S1", "tablet", '{"type": "JOB_STATUS"}', True)]
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("k", fn) for _ in range(3)))
+        return flights, calls, results
+
+    flights, calls, results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True]
+    assert all(result == "result" for result, _ in results)
+    assert len(flights) == 0
+    assert flights.stats == {"leaders": 1, "shared": 2}
+
+
+def test_error_is_shared_and_key_is_forgotten():
+    async def scenario():
+        flights = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+
+        results = await asyncio.gather(flights.do("k", fn), flights.do("k", fn), return_exceptions=True)
+        # Nothing cached: the next caller starts a fresh call
+        with pytest.raises(RuntimeError):
+            await flights.do("k", fn)
+        return flights, calls, results
+
+    flights, calls, results = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert results[0] is results[1]
+    assert len(calls) == 2
+    assert len(flights) == 0
+
+
+def test_one_waiter_leaving_does_not_cancel_the_call():
+    async def scenario():
+        flights = SingleFlight()
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "result"
+
+        leaver = asyncio.create_task(flights.do("k", fn))
+        stayer = asyncio.create_task(flights.do("k", fn))
+        await asyncio.sleep(0)
+        leaver.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return leaver, await stayer
+
+    leaver, (result, shared) = asyncio.run(scenario())
+    assert leaver.cancelled()
+    assert result == "result" and shared
+
+
+def test_last_waiter_leaving_cancels_the_call():
+    async def scenario():
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def fn():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.create_task(flights.do("k", fn)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for w in waiters:
+            w.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.sleep(0)
+        return flights
+
+    flights = asyncio.run(scenario())
+    assert len(flights) == 0
@@ -0,0 +1,127 @@
+import asyncio
+from io import BytesIO
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+from uploads import UploadLimit, read_upload
+
+
+def _scope(path="/api/edit", method="POST", content_length=None):
+    headers = [(b"content-type", b"multipart/form-data; boundary=x")]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    return {"type": "http", "method": method, "path": path, "headers": headers}
+
+
+def _drive(app, scope, chunks):
+    """Run an ASGI app over a body split into `chunks`; return the sent messages and how much was read."""
+    async def main():
+        pending = [{"type": "http.request", "body": c, "more_body": i < len(chunks) - 1}
+                   for i, c in enumerate(chunks)]
+        read = []
+
+        async def receive():
+            if pending:
+                message = pending.pop(0)
+                read.append(message["body"])
+                return message
+            return {"type": "http.disconnect"}
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, receive, send)
+        return sent, read
+
+    return asyncio.run(main())
+
+
+def _status(sent):
+    starts = [m for m in sent if m["type"] == "http.response.start"]
+    assert len(starts) == 1, sent
+    return starts[0]["status"]
+
+
+async def _read_all_then_ok(scope, receive, send):
+    """Stands in for the route: drains the body, answers 200 with its size."""
+    total = 0
+    while True:
+        message = await receive()
+        total += len(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": str(total).encode()})
+
+
+async def _parser_turns_errors_into_400(scope, receive, send):
+    """Like the form parser: swallows the aborted read and answers 400 itself."""
+    try:
+        await _read_all_then_ok(scope, receive, send)
+    except HTTPException:
+        await send({"type": "http.response.start", "status": 400, "headers": []})
+        await send({"type": "http.response.body", "body": b"bad form"})
+
+
+def test_declared_length_over_cap_is_rejected_unread():
+    called = []
+
+    async def app(scope, receive, send):
+        called.append(1)
+
+    sent, read = _drive(UploadLimit(app, 100, ["/api/edit"]), _scope(content_length=101), [b"x" * 101])
+    assert _status(sent) == 413
+    assert called == [] and read == []
+    assert (b"connection", b"close") in sent[0]["headers"]
+
+
+def test_chunked_body_cut_off_mid_stream():
+    app = UploadLimit(_read_all_then_ok, 100, ["/api/edit"])
+    sent, read = _drive(app, _scope(), [b"x" * 40] * 10)
+    assert _status(sent) == 413
+    # Reading stopped at the chunk that crossed the cap
+    assert len(read) == 3
+
+
+def test_app_response_is_replaced_by_413():
+    app = UploadLimit(_parser_turns_errors_into_400, 100, ["/api/edit"])
+    sent, _ = _drive(app, _scope(content_length=10), [b"x" * 60, b"x" * 60])  # understated length
+    assert _status(sent) == 413
+    assert b"bad form" not in b"".join(m.get("body", b"") for m in sent)
+
+
+def test_body_within_cap_and_other_routes_pass_through():
+    app = UploadLimit(_read_all_then_ok, 100, ["/api/edit"])
+    sent, _ = _drive(app, _scope(content_length=100), [b"x" * 50, b"x" * 50])
+    assert _status(sent) == 200 and sent[1]["body"] == b"100"
+
+    sent, _ = _drive(app, _scope(path="/api/other"), [b"x" * 500])
+    assert _status(sent) == 200
+    sent, _ = _drive(app, _scope(method="PUT", content_length=500), [b"x" * 500])
+    assert _status(sent) == 200
+
+
+def _upload(data: bytes, size=None) -> UploadFile:
+    return UploadFile(BytesIO(data), size=size, filename="photo.jpg")
+
+
+def test_read_upload_within_cap():
+    data = bytes(range(256)) * 10
+    assert asyncio.run(read_upload(_upload(data, len(data)), len(data), chunk_size=100)) == data
+
+
+@pytest.mark.parametrize("size", [300, None])
+def test_read_upload_over_cap(size):
+    # With a known size it is refused up front, otherwise while reading
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(read_upload(_upload(b"x" * 300, size), 200, chunk_size=64))
+    assert raised.value.status_code == 413
+
+
+def test_read_upload_with_understated_size():
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(read_upload(_upload(b"x" * 300, size=10), 200, chunk_size=64))
+    assert raised.value.status_code == 413
@@ -0,0 +1,54 @@
+import asyncio
+import os
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from imaging import CorruptImage, decode_and_prepare
+from workpool import ImagePool
+
+FORMATS = ["JPEG", "PNG", "WEBP"]
+
+
+def _png(size=(640, 480)) -> bytes:
+    out = BytesIO()
+    Image.new("RGB", size, (200, 40, 90)).save(out, "PNG")
+    return out.getvalue()
+
+
+def _shm_segments() -> set:
+    # SharedMemory names its segments psm_*; the executor's own sem.* locks are not ours
+    return {name for name in os.listdir("/dev/shm") if name.startswith("psm_")}
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        ImagePool("fork")
+
+
+@pytest.mark.skipif(not os.path.isdir("/dev/shm"), reason="needs POSIX shared memory in /dev/shm")
+def test_process_pool_does_not_leak_shared_memory():
+    data = _png()
+    before = _shm_segments()
+
+    async def scenario():
+        pool = ImagePool("process", 1)
+        try:
+            await pool.warm()
+            results = await asyncio.gather(
+                *(pool.run(decode_and_prepare, data, FORMATS, 40_000_000, 256, "JPEG", 80) for _ in range(3))
+            )
+            # A failing call unlinks its segment too
+            with pytest.raises(CorruptImage):
+                await pool.run(decode_and_prepare, data[:200], FORMATS, 40_000_000, 256, "JPEG", 80)
+            return results, pool.snapshot()
+        finally:
+            pool.shutdown()
+
+    results, snap = asyncio.run(scenario())
+    for prepared, digest, timings in results:
+        assert prepared.image is None and prepared.size == (256, 192)
+        assert digest == results[0][1] and set(timings) == {"decode", "preprocess"}
+    assert snap["tasks"] == 5 and snap["errors"] == 1 and snap["busy"] == 0
+    assert _shm_segments() - before == set()
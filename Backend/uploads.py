@@ -0,0 +1,86 @@
+"""
+Bounded upload ingestion.
+
+UploadLimit is an ASGI middleware for the upload routes. A declared
+Content-Length over the cap is answered with 413 before any body is read;
+a chunked (or understated) body is cut off as soon as the running total
+passes the cap, while Starlette is still streaming it into its spooled temp
+file, and answered with 413. read_upload() then copies the spooled file into memory in chunks,
+again bounded, so one request never holds more than the cap.
+"""
+from typing import Sequence
+
+from fastapi import HTTPException, UploadFile
+from starlette.responses import JSONResponse
+
+CHUNK_SIZE = 256 * 1024
+
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds {limit} bytes")
+
+
+async def read_upload(upload: UploadFile, max_bytes: int, chunk_size: int = CHUNK_SIZE) -> bytes:
+    if upload.size is not None and upload.size > max_bytes:
+        raise _too_large(max_bytes)
+    chunks, total = [], 0
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise _too_large(max_bytes)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class UploadLimit:
+    def __init__(self, app, max_body_bytes: int, paths: Sequence[str]):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.paths = tuple(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.paths):
+            return await self.app(scope, receive, send)
+
+        limit = self.max_body_bytes
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            return await self._reject(scope, receive, send)
+
+        received = 0
+        over = False
+
+        async def limited_receive():
+            nonlocal received, over
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    over = True
+                    raise _too_large(limit)
+            return message
+
+        async def guarded_send(message):
+            # Once the body was cut off, whatever the app makes of the aborted
+            # read (a 400 from the form parser, a 500) is replaced by our 413
+            if not over:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not over:
+                raise
+        if over:
+            await self._reject(scope, receive, send)
+
+    async def _reject(self, scope, receive, send):
+        response = JSONResponse(
+            {"detail": f"Upload exceeds {self.max_body_bytes} bytes"},
+            status_code=413,
+            headers={"Connection": "close"},
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,89 @@
+"""
+Where CPU-bound image work runs (decode, resize, re-encode, transcode).
+
+  inline   on the event-loop thread, as before
+  thread   ThreadPoolExecutor. Pillow releases the GIL inside its decoders,
+           encoders and resamplers, so frames are processed in parallel on
+           multi-core hosts and the loop keeps serving sockets meanwhile.
+  process  ProcessPoolExecutor (spawn). The input buffer is handed over
+           through multiprocessing.shared_memory instead of being pickled
+           down the pipe; results (already compressed) come back pickled.
+
+Functions run here must be module-level (importable by the workers) and
+take the input bytes as their first argument.
+"""
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional
+
+MODES = ("inline", "thread", "process")
+
+
+def _call_with_shm(fn: Callable, name: str, size: int, args: tuple) -> Any:
+    """Worker side: read the input from shared memory, then run fn on it."""
+    # Spawned workers share the parent's resource tracker, which already
+    # tracks this segment; the parent unlinks it once the call returns
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    return fn(data, *args)
+
+
+class ImagePool:
+    def __init__(self, mode: str = "thread", workers: int = 4):
+        if mode not in MODES:
+            raise ValueError(f"Unknown IMAGE_POOL mode: {mode} (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._executor: Optional[Executor] = None
+        if mode == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image")
+        elif mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+        self.busy = 0
+        self.stats = {"tasks": 0, "errors": 0, "busy_total_s": 0.0}
+
+    async def run(self, fn: Callable, data: bytes, *args) -> Any:
+        started = time.perf_counter()
+        self.busy += 1
+        self.stats["tasks"] += 1
+        try:
+            if self.mode == "inline":
+                return fn(data, *args)
+            loop = asyncio.get_running_loop()
+            if self.mode == "thread":
+                return await loop.run_in_executor(self._executor, fn, data, *args)
+            return await self._run_shared(loop, fn, data, args)
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self.busy -= 1
+            self.stats["busy_total_s"] += time.perf_counter() - started
+
+    async def _run_shared(self, loop, fn: Callable, data: bytes, args: tuple) -> Any:
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        try:
+            shm.buf[:len(data)] = data
+            return await loop.run_in_executor(self._executor, _call_with_shm, fn, shm.name, len(data), args)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def warm(self):
+        """Start every worker now, so the first upload doesn't pay for process spawn."""
+        if self.mode == "process":
+            await asyncio.gather(*(self.run(len, b"") for _ in range(self.workers)))
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "mode": self.mode, "workers": self.workers, "busy": self.busy}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
@@ -5,6 +5,7 @@ import { PlugZap, Activity, Settings2 } from "lucide-react";
 import WelcomeScreen from "./components/WelcomeScreen";
 import ConsentScreen from "./components/ConsentScreen";
 import MainEditor from "./components/MainEditor";
+import { unpackFrame } from "./frames";
 
 const RAW_BASE = import.meta.env.VITE_API_BASE || "http://localhost:8000";
 const WS_BASE = RAW_BASE.replace(/^http/i, "ws");
@@ -80,6 +81,14 @@ export default function App() {
     // try { wsRef.current?.close(); } catch {}
   };
 
+  // Object URLs from binary results are released once replaced
+  const objectUrlRef = useRef(null);
+  const showResult = (url) => {
+    if (objectUrlRef.current) URL.revokeObjectURL(objectUrlRef.current);
+    objectUrlRef.current = url.startsWith("blob:") ? url : null;
+    setResultUrl(url);
+  };
+
   const connectWS = () => {
     setError("");
     if (!sessionCode) {
@@ -87,9 +96,12 @@ export default function App() {
       return;
     }
     try {
+      // binary=1: results arrive as raw image frames; the server turns them
+      // into {type:"RESULT", dataUrl} for clients that don't ask for this
       const ws = new WebSocket(
-        `${WS_BASE}/ws?session=${encodeURIComponent(sessionCode)}&role=tablet`
+        `${WS_BASE}/ws?session=${encodeURIComponent(sessionCode)}&role=tablet&binary=1`
       );
+      ws.binaryType = "arraybuffer";
       ws.onopen = () => {
         setWsConnected(true);
         setUserStep(1); 
@@ -103,8 +115,20 @@ export default function App() {
         setWsConnected(false);
       };
       ws.onmessage = (ev) => {
+        if (ev.data instanceof ArrayBuffer) {
+          const frame = unpackFrame(ev.data);
+          if (frame && frame.type === "RESULT") {
+            const blob = new Blob([frame.payload], { type: frame.mime || "image/png" });
+            showResult(URL.createObjectURL(blob));
+          }
+          return;
+        }
         const msg = safeParse(ev.data);
         if (!msg) return;
+        if (msg.type === "PING") {
+            ws.send(JSON.stringify({ type: "PONG", ts: msg.ts }));
+            return;
+        }
         if (msg.type === "PEER_STATUS" && msg.role === "kiosk") {
             setKioskStatus(msg.status);
         }
@@ -113,7 +137,7 @@ export default function App() {
             setCanSend(true);
         }
         if (msg.type === "RESULT" && msg.dataUrl) {
-            setResultUrl(msg.dataUrl);
+            showResult(msg.dataUrl);
             // We can also reset canSend here if needed for the next capture
             // setCanSend(false);
         }
@@ -0,0 +1,26 @@
+// Binary WebSocket frames, same layout as Backend/frames.py (big-endian):
+//   u8 version | u8 flags | u8 n, type | u8 m, mime | u32 length, payload
+// We connect without compress=deflate, so the server never sends deflated payloads.
+const FRAME_VERSION = 1;
+const decoder = new TextDecoder("ascii");
+
+export function unpackFrame(data) {
+  try {
+    const bytes = new Uint8Array(data);
+    const view = new DataView(data);
+    if (bytes[0] !== FRAME_VERSION) return null;
+    let pos = 2;
+    const tlen = bytes[pos++];
+    const type = decoder.decode(bytes.subarray(pos, pos + tlen));
+    pos += tlen;
+    const mlen = bytes[pos++];
+    const mime = decoder.decode(bytes.subarray(pos, pos + mlen));
+    pos += mlen;
+    const length = view.getUint32(pos);
+    pos += 4;
+    if (pos + length !== bytes.length) return null;
+    return { type, mime, payload: bytes.subarray(pos) };
+  } catch {
+    return null;
+  }
+}
@@ -10,11 +10,19 @@ import TitleDisplay from "./components/TitleDisplay";
 import ProcessingDisplay from "./components/ProcessingDisplay";
 import PulsingOrb from "./components/PulsingOrb"; 
 import FloatingIconsFooter from "./components/FloatingIconsFooter";
+import { packFrame } from "./frames";
 
 const RAW_BASE = import.meta.env.VITE_API_BASE || "http://localhost:8000";
 const BACKEND_URL = RAW_BASE.replace(/\/+$/, "");
 const WS_BASE = BACKEND_URL.replace(/^http/i, "ws");
 
+// URL the tablet can load: the stored result on the backend when available
+// (blob: URLs only resolve inside the kiosk page)
+const shareableUrl = (response, objectUrl) => {
+  const path = response.headers.get("X-Result-Url");
+  return path ? `${BACKEND_URL}${path}` : objectUrl;
+};
+
 
 function CountdownOverlay({ value }) {
   if (!value || value <= 0) return null;
@@ -38,7 +46,12 @@ export default function App() {
   const videoRef = useRef(null);
   const canvasRef = useRef(null);
   const wsRef = useRef(null);
+  const binaryRef = useRef(false); // server accepted binary frames on this socket
   const capturedUrlRef = useRef(null);
+  const captureIdRef = useRef(null); // Promise<captureId | null> for the staged photo
+  const sessionIdRef = useRef("");
+  // Server-side id of the latest result, so REFINE doesn't re-upload it
+  const lastResultIdRef = useRef(null);
 
   const [sessionId, setSessionId] = useState("");
   const [connected, setConnected] = useState(false);
@@ -90,11 +103,42 @@ export default function App() {
     }
   };
 
+  // Hand the photo to the backend right away; the edit then only sends the prompt
+  const stageCapture = async (dataUrl) => {
+    try {
+      const imgBlob = await (await fetch(dataUrl)).blob();
+      const form = new FormData();
+      form.append("image_file", imgBlob, "capture.png");
+      form.append("session", sessionIdRef.current);
+      const r = await fetch(`${BACKEND_URL}/api/captures`, { method: "POST", body: form });
+      if (!r.ok) return null;
+      return (await r.json()).captureId;
+    } catch (err) {
+      console.error("Capture pre-upload failed:", err);
+      return null;
+    }
+  };
+
   const sendWS = (obj) => {
     const ws = wsRef.current;
     if (ws && ws.readyState === 1) ws.send(JSON.stringify(obj));
   };
 
+  // The result's bytes go to the tablet as one binary frame (no base64, no
+  // second download); the JSON link to the stored copy is the fallback
+  const sendResult = async (response, blob, objectUrl) => {
+    const ws = wsRef.current;
+    if (ws && ws.readyState === 1 && binaryRef.current) {
+      try {
+        ws.send(await packFrame("RESULT", blob));
+        return;
+      } catch (err) {
+        console.error("Binary RESULT failed, sending a link instead:", err);
+      }
+    }
+    sendWS({ type: "RESULT", dataUrl: shareableUrl(response, objectUrl) });
+  };
+
   const handleRefineRequest = async (prompt) => {
     // --- FIX: Read the URL from the ref to get the latest value ---
     const currentResultUrl = resultUrlRef.current;
@@ -108,18 +152,26 @@ export default function App() {
     setRendering(true);
     
     try {
-      const imgBlob = await (await fetch(currentResultUrl)).blob();
       const form = new FormData();
-      form.append("image_file", imgBlob, "refine.png");
       form.append("prompt", prompt.trim());
-      
-      const response = await fetch(`${BACKEND_URL}/api/edit`, { method: "POST", body: form });
+      form.append("session", sessionIdRef.current);
+      form.append("base_result", lastResultIdRef.current || "last");
+
+      let response = await fetch(`${BACKEND_URL}/api/edit`, { method: "POST", body: form });
+      if (response.status === 404) {
+        // Result no longer held server-side: fall back to uploading it
+        const imgBlob = await (await fetch(currentResultUrl)).blob();
+        form.delete("base_result");
+        form.append("image_file", imgBlob, "refine.png");
+        response = await fetch(`${BACKEND_URL}/api/edit`, { method: "POST", body: form });
+      }
       if (!response.ok) throw new Error("Backend error during refine");
+      lastResultIdRef.current = response.headers.get("X-Result-Id");
       
       const blob = await response.blob();
       const newObjectUrl = URL.createObjectURL(blob);
       setResultUrl(newObjectUrl); // This will trigger the useEffect to update the ref
-      sendWS({ type: "RESULT", dataUrl: newObjectUrl });
+      await sendResult(response, blob, newObjectUrl);
     } catch (err) {
       console.error("REFINE failed:", err);
     } finally {
@@ -127,15 +179,23 @@ export default function App() {
     }
   };
   const connectWS = (sid) => {
-    const ws = new WebSocket(`${WS_BASE}/ws?session=${encodeURIComponent(sid)}&role=kiosk`);
+    sessionIdRef.current = sid;
+    const ws = new WebSocket(`${WS_BASE}/ws?session=${encodeURIComponent(sid)}&role=kiosk&binary=1`);
     ws.onopen = () => setConnected(true);
     ws.onclose = () => setConnected(false);
     ws.onerror = () => setConnected(false);
     ws.onmessage = async (ev) => {
+      if (typeof ev.data !== "string") return; // the tablet sends no binary frames
       const msg = safeParse(ev.data);
       if (!msg || !msg.type) return;
 
       switch (msg.type) {
+        case "CONNECTED":
+          binaryRef.current = !!msg.binary;
+          break;
+        case "PING":
+          ws.send(JSON.stringify({ type: "PONG", ts: msg.ts }));
+          break;
         case "PEER_STATUS":
           if (msg.role === "tablet") setTabletOnline(msg.status === "online");
           break;
@@ -155,6 +215,7 @@ export default function App() {
             async () => {
               const dataUrl = await captureStill();
               capturedUrlRef.current = dataUrl;
+              captureIdRef.current = stageCapture(dataUrl);
               setShowCapturedImage(true);
               stopCamera();
               sendWS({ type: "CAPTURED" });
@@ -174,18 +235,30 @@ export default function App() {
           setResultUrl("");
           // alert("1")
           try {
-            const imgBlob = await (await fetch(capturedUrlRef.current)).blob();
             const form = new FormData();
-            form.append("image_file", imgBlob, "capture.png");
             form.append("prompt", msg.prompt.trim());
-            const response = await fetch(`${BACKEND_URL}/api/edit`, { method: "POST", body: form });
+            form.append("session", sessionIdRef.current);
+            const captureId = await captureIdRef.current;
+            let response = null;
+            if (captureId) {
+              form.append("capture", captureId);
+              response = await fetch(`${BACKEND_URL}/api/edit`, { method: "POST", body: form });
+            }
+            if (!response || response.status === 404) {
+              // Not staged (or expired): send the photo along with the prompt
+              const imgBlob = await (await fetch(capturedUrlRef.current)).blob();
+              form.delete("capture");
+              form.append("image_file", imgBlob, "capture.png");
+              response = await fetch(`${BACKEND_URL}/api/edit`, { method: "POST", body: form });
+            }
             if (!response.ok) throw new Error("Backend error");
+            lastResultIdRef.current = response.headers.get("X-Result-Id");
             const blob = await response.blob();
             const objectUrl = URL.createObjectURL(blob);
             console.log(objectUrl)
             setResultUrl(objectUrl);
            
-            sendWS({ type: "RESULT", dataUrl: objectUrl });
+            await sendResult(response, blob, objectUrl);
           } catch (err) {
             console.error("EDIT failed:", err);
             setRendering(false);
@@ -0,0 +1,24 @@
+// Binary WebSocket frames, same layout as Backend/frames.py (big-endian):
+//   u8 version | u8 flags | u8 n, type | u8 m, mime | u32 length, payload
+// Results go to the tablet as raw image bytes instead of a base64 data URL.
+const FRAME_VERSION = 1;
+const encoder = new TextEncoder();
+
+export async function packFrame(type, blob) {
+  const t = encoder.encode(type);
+  const m = encoder.encode(blob.type || "");
+  const payload = new Uint8Array(await blob.arrayBuffer());
+  const buf = new Uint8Array(3 + t.length + 1 + m.length + 4 + payload.length);
+  let pos = 0;
+  buf[pos++] = FRAME_VERSION;
+  buf[pos++] = 0; // flags: images are already compressed, no deflate
+  buf[pos++] = t.length;
+  buf.set(t, pos);
+  pos += t.length;
+  buf[pos++] = m.length;
+  buf.set(m, pos);
+  pos += m.length;
+  new DataView(buf.buffer).setUint32(pos, payload.length);
+  buf.set(payload, pos + 4);
+  return buf.buffer;
+}
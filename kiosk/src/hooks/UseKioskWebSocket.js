@@ -46,7 +46,9 @@ export default function useKioskWebSocket(backendUrl, onMessage) {
         const msg = safeParse(ev.data);
         if (!msg || !msg.type) return;
 
-        if (msg.type === "PEER_STATUS" && msg.role === "tablet") {
+        if (msg.type === "PING") {
+          ws.send(JSON.stringify({ type: "PONG", ts: msg.ts }));
+        } else if (msg.type === "PEER_STATUS" && msg.role === "tablet") {
           setTabletOnline(msg.status === "online");
         } else {
             onMessageRef.current?.(msg);